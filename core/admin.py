@@ -19,7 +19,7 @@ from .models import (
 # =========================
 @admin.register(Autor)
 class AutorAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "nacionalidad", "fecha_nacimiento")
+    list_display = ("nombre", "nacionalidad", "fecha_nacimiento", "numero_libros")
     search_fields = ("nombre", "nacionalidad")
     list_filter = ("nacionalidad",)
     ordering = ("nombre",)
@@ -30,7 +30,7 @@ class AutorAdmin(admin.ModelAdmin):
 # =========================
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
-    list_display = ("nombre",)
+    list_display = ("nombre", "numero_libros")
     search_fields = ("nombre",)
     ordering = ("nombre",)
 
@@ -81,7 +81,12 @@ class LibroAdmin(admin.ModelAdmin):
     )
     search_fields = ("titulo", "autor__nombre", "isbn")
     filter_horizontal = ("categorias",)
-    readonly_fields = ("fecha_agregado", "fecha_actualizado")
+    readonly_fields = (
+        "fecha_agregado",
+        "fecha_actualizado",
+        "calificacion_promedio",
+        "numero_resenas",
+    )
     inlines = [ResenaInline]
 
     fieldsets = (
@@ -121,6 +126,15 @@ class LibroAdmin(admin.ModelAdmin):
                 )
             },
         ),
+        (
+            "Reseñas",
+            {
+                "fields": (
+                    "calificacion_promedio",
+                    "numero_resenas",
+                )
+            },
+        ),
         (
             "Control",
             {
@@ -176,8 +190,10 @@ class PrestamoAdmin(admin.ModelAdmin):
 
     @admin.action(description="Marcar préstamos seleccionados como devueltos")
     def marcar_como_devuelto(self, request, queryset):
-        for prestamo in queryset:
-            prestamo.devolver()
+        devueltos = Prestamo.devolver_lote(queryset.values_list("pk", flat=True))
+        self.message_user(
+            request, f"{len(devueltos)} préstamos marcados como devueltos"
+        )
 
     @admin.display(boolean=True)
     def esta_vencido(self, obj):
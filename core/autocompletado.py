@@ -0,0 +1,206 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from .busqueda import normalizar
+from .cache import incrementar_version, versiones_modelos
+from .models import Autor, Libro
+
+# Versión de cache propia del índice: solo cambia con títulos, ISBN y
+# nombres de autor, no con reseñas ni préstamos que también tocan Libro
+VERSION_INDICE = "autocompletado"
+
+
+class IndicePrefijos:
+    """Índice en memoria (arreglo ordenado) de títulos, autores e ISBN.
+
+    Cada proceso mantiene su propia copia: se construye en segundo plano
+    al arrancar (o en la primera consulta) y se actualiza de forma
+    incremental desde los signals de este proceso. Mientras no está listo
+    las consultas van a la base de datos. Cuando vence su TTL compara
+    VERSION_INDICE en la cache compartida y solo se reconstruye, también en
+    segundo plano, si otro proceso cambió algún texto indexado.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entradas = []  # (clave, tipo, id, etiqueta) ordenadas por clave
+        self._por_objeto = {}  # (tipo, id) -> entradas del objeto
+        self._construido = None
+        self._version = None
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entradas_libro(pk, titulo, isbn):
+        entradas = [(normalizar(titulo), "libro", pk, titulo)]
+        if isbn:
+            # Misma clave que el prefijo buscado: la X final queda en minúscula
+            entradas.append((normalizar(isbn), "isbn", pk, titulo))
+        return entradas
+
+    @staticmethod
+    def _entradas_autor(pk, nombre):
+        return [(normalizar(nombre), "autor", pk, nombre)]
+
+    def construir(self):
+        """Reconstruye el índice completo desde la base de datos"""
+        version = versiones_modelos(VERSION_INDICE)
+        entradas = []
+        por_objeto = {}
+        for pk, titulo, isbn in (
+            Libro.objects.order_by()
+            .values_list("pk", "titulo", "isbn")
+            .iterator(chunk_size=5000)
+        ):
+            por_objeto[("libro", pk)] = self._entradas_libro(pk, titulo, isbn)
+            entradas.extend(por_objeto[("libro", pk)])
+        for pk, nombre in Autor.objects.order_by().values_list("pk", "nombre"):
+            por_objeto[("autor", pk)] = self._entradas_autor(pk, nombre)
+            entradas.extend(por_objeto[("autor", pk)])
+        entradas.sort()
+
+        with self._lock:
+            self._entradas = entradas
+            self._por_objeto = por_objeto
+            self._construido = time.monotonic()
+            self._version = version
+
+    def _construyendo(self):
+        # Tras un fork el hilo del padre ya no está vivo en el hijo
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def calentar(self):
+        """Construye el índice en segundo plano si no se está construyendo ya"""
+
+        def construir():
+            try:
+                self.construir()
+            except DatabaseError:
+                # Tablas aún sin migrar: se reintenta en la próxima consulta
+                pass
+            finally:
+                connection.close()
+
+        with self._lock:
+            if self._construyendo():
+                return
+            self._hilo = threading.Thread(target=construir, daemon=True)
+            self._hilo.start()
+
+    def _reemplazar(self, objeto, nuevas):
+        """Sustituye las entradas del objeto; devuelve si cambiaron"""
+        with self._lock:
+            if self._construido is None:
+                # Sin índice no se puede comparar: se asume que cambiaron
+                return True
+            anteriores = self._por_objeto.pop(objeto, [])
+            if anteriores == nuevas:
+                if nuevas:
+                    self._por_objeto[objeto] = nuevas
+                return False
+            for entrada in anteriores:
+                posicion = bisect_left(self._entradas, entrada)
+                if (
+                    posicion < len(self._entradas)
+                    and self._entradas[posicion] == entrada
+                ):
+                    del self._entradas[posicion]
+            for entrada in nuevas:
+                insort(self._entradas, entrada)
+            if nuevas:
+                self._por_objeto[objeto] = nuevas
+            return True
+
+    def _aplicar(self, objeto, nuevas):
+        if not self._reemplazar(objeto, nuevas):
+            return
+        version = incrementar_version(VERSION_INDICE)
+        with self._lock:
+            # Si nadie más cambió el índice, esta copia sigue al día
+            if self._version is not None and self._version[0] + 1 == version[0]:
+                self._version = version
+
+    def actualizar_libro(self, libro):
+        self._aplicar(
+            ("libro", libro.pk),
+            self._entradas_libro(libro.pk, libro.titulo, libro.isbn),
+        )
+
+    def actualizar_autor(self, autor):
+        self._aplicar(("autor", autor.pk), self._entradas_autor(autor.pk, autor.nombre))
+
+    def eliminar(self, tipo, pk):
+        self._aplicar((tipo, pk), [])
+
+    def _entradas_bd(self, prefijo, limite):
+        """Entradas que empiezan por el prefijo, consultadas en la base de datos"""
+        entradas = [
+            (clave, "libro", pk, titulo)
+            for pk, clave, titulo in Libro.objects.filter(
+                titulo_normalizado__startswith=prefijo
+            )
+            .order_by("titulo_normalizado")
+            .values_list("pk", "titulo_normalizado", "titulo")[:limite]
+        ]
+        entradas.extend(
+            (clave, "autor", pk, nombre)
+            for pk, clave, nombre in Autor.objects.filter(
+                nombre_normalizado__startswith=prefijo
+            )
+            .order_by("nombre_normalizado")
+            .values_list("pk", "nombre_normalizado", "nombre")[:limite]
+        )
+        # El ISBN se guarda tal cual: se busca la X final en ambas formas con
+        # startswith, que usa el índice, en lugar de istartswith
+        entradas.extend(
+            (normalizar(isbn), "isbn", pk, titulo)
+            for pk, isbn, titulo in Libro.objects.filter(
+                Q(isbn__startswith=prefijo) | Q(isbn__startswith=prefijo.upper())
+            )
+            .order_by("isbn")
+            .values_list("pk", "isbn", "titulo")[:limite]
+        )
+        return sorted(entradas)
+
+    def buscar(self, texto, limite=8):
+        """Devuelve hasta `limite` entradas cuyo texto empieza por el prefijo"""
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+
+        if self._construido is None:
+            self.calentar()
+            entradas = self._entradas_bd(prefijo, limite)
+        else:
+            if (
+                time.monotonic() - self._construido > self.ttl
+                and not self._construyendo()
+            ):
+                if versiones_modelos(VERSION_INDICE) != self._version:
+                    self.calentar()
+                else:
+                    self._construido = time.monotonic()
+            entradas = None
+
+        resultados = []
+        vistos = set()
+        with self._lock:
+            if entradas is None:
+                entradas = self._entradas
+            posicion = bisect_left(entradas, (prefijo,))
+            while posicion < len(entradas) and len(resultados) < limite:
+                clave, tipo, pk, etiqueta = entradas[posicion]
+                if not clave.startswith(prefijo):
+                    break
+                if (tipo, pk) not in vistos:
+                    vistos.add((tipo, pk))
+                    resultados.append({"id": pk, "tipo": tipo, "etiqueta": etiqueta})
+                posicion += 1
+        return resultados
+
+
+indice_autocompletado = IndicePrefijos()
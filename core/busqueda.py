@@ -0,0 +1,162 @@
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+
+from .models import Autor, Libro
+
+# Configuración de Postgres usada para el stemming en español
+CONFIGURACION = "spanish"
+
+# Máximo de autores candidatos que se combinan en la búsqueda aproximada
+MAX_AUTORES_APROXIMADOS = 50
+
+# Umbral de similitud más bajo aceptado: por debajo el índice trigram casi no
+# descarta filas y la consulta equivale a recorrer la tabla entera
+UMBRAL_MINIMO = 0.1
+
+
+def normalizar(texto):
+    """Texto en minúsculas y sin acentos para comparaciones aproximadas"""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())
+
+
+def vector_libro():
+    """Vector ponderado: título e ISBN (A) > autor (B) > descripción (C)"""
+    nombre_autor = Subquery(
+        Autor.objects.filter(pk=OuterRef("autor_id")).values("nombre")[:1]
+    )
+    return (
+        SearchVector("titulo", "isbn", weight="A", config=CONFIGURACION)
+        + SearchVector(nombre_autor, weight="B", config=CONFIGURACION)
+        + SearchVector("descripcion", weight="C", config=CONFIGURACION)
+    )
+
+
+def actualizar_vector_busqueda(libros):
+    """Recalcula el vector de búsqueda de los libros indicados"""
+    return libros.update(vector_busqueda=vector_libro())
+
+
+def consulta_texto(texto):
+    return SearchQuery(texto, config=CONFIGURACION, search_type="websearch")
+
+
+def filtrar_por_texto(queryset, texto):
+    """Filtra por texto completo usando el índice GIN, sin ordenar ni anotar"""
+    return queryset.filter(vector_busqueda=consulta_texto(texto))
+
+
+def buscar_libros(queryset, texto):
+    """Filtra por texto completo y ordena por relevancia con fragmento resaltado"""
+    consulta = consulta_texto(texto)
+    return (
+        queryset.filter(vector_busqueda=consulta)
+        .annotate(
+            relevancia=SearchRank(F("vector_busqueda"), consulta),
+            fragmento=SearchHeadline(
+                "descripcion",
+                consulta,
+                config=CONFIGURACION,
+                start_sel="<mark>",
+                stop_sel="</mark>",
+                max_words=35,
+                min_words=15,
+            ),
+        )
+        .order_by("-relevancia", "-fecha_agregado")
+    )
+
+
+def fijar_umbral(umbral=None):
+    """Fija el umbral de similitud del operador %> para la transacción actual.
+
+    Se usa set_config local para que el valor no quede en la conexión, que
+    se reutiliza entre peticiones; por eso hay que llamarla dentro de
+    transaction.atomic() y evaluar ahí las consultas aproximadas.
+    """
+    if not connection.in_atomic_block:
+        raise TransactionManagementError(
+            "fijar_umbral debe llamarse dentro de transaction.atomic()"
+        )
+    if umbral is None:
+        umbral = settings.BUSQUEDA_UMBRAL_SIMILITUD
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+            [str(umbral)],
+        )
+
+
+def buscar_libros_aproximado(queryset, texto, umbral=None):
+    """Búsqueda tolerante a errores y acentos sobre título y nombre del autor.
+
+    El queryset devuelto depende del umbral fijado en la transacción, así que
+    debe evaluarse dentro del mismo transaction.atomic() que esta llamada.
+    """
+    normalizado = normalizar(texto)
+    fijar_umbral(umbral)
+    # Los autores se resuelven aparte para que ambas ramas usen su índice
+    autores = list(
+        Autor.objects.filter(nombre_normalizado__trigram_word_similar=normalizado)
+        .order_by()
+        .values_list("pk", flat=True)[:MAX_AUTORES_APROXIMADOS]
+    )
+    return (
+        queryset.filter(
+            Q(titulo_normalizado__trigram_word_similar=normalizado)
+            | Q(autor_id__in=autores)
+        )
+        .annotate(
+            relevancia=Greatest(
+                TrigramWordSimilarity(normalizado, "titulo_normalizado"),
+                TrigramWordSimilarity(normalizado, "autor__nombre_normalizado"),
+            )
+        )
+        .order_by("-relevancia", "-fecha_agregado")
+    )
+
+
+def sugerencias(texto, limite=5, umbral=None):
+    """Títulos y autores parecidos al texto ("quizás quisiste decir")"""
+    normalizado = normalizar(texto)
+    with transaction.atomic():
+        fijar_umbral(umbral)
+        titulos = list(
+            Libro.objects.filter(titulo_normalizado__trigram_word_similar=normalizado)
+            .annotate(
+                similitud=TrigramWordSimilarity(normalizado, "titulo_normalizado")
+            )
+            .order_by("-similitud")
+            .values_list("titulo", "similitud")[:limite]
+        )
+        nombres = list(
+            Autor.objects.filter(nombre_normalizado__trigram_word_similar=normalizado)
+            .annotate(
+                similitud=TrigramWordSimilarity(normalizado, "nombre_normalizado")
+            )
+            .order_by("-similitud")
+            .values_list("nombre", "similitud")[:limite]
+        )
+    candidatos = sorted([*titulos, *nombres], key=lambda c: c[1], reverse=True)
+
+    resultado = []
+    vistos = {normalizado}
+    for texto_sugerido, _ in candidatos:
+        clave = normalizar(texto_sugerido)
+        if clave not in vistos:
+            vistos.add(clave)
+            resultado.append(texto_sugerido)
+    return resultado[:limite]
@@ -0,0 +1,248 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import parse_header_parameters
+
+# Segundos por defecto de una entrada cacheada por versión de modelo
+TTL_VERSIONADO = 60 * 60
+
+_FALTA = object()
+
+
+class CacheDosNiveles(BaseCache):
+    """LRU acotada en memoria del proceso delante de una cache compartida.
+
+    Las lecturas se sirven desde la LRU local mientras no venza su TTL
+    corto; las escrituras y borrados pasan siempre por la cache compartida.
+    Otros procesos pueden ver un valor borrado hasta TTL_LOCAL segundos.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get("OPTIONS", {})
+        self._alias_compartida = opciones.get("COMPARTIDA", "compartida")
+        self._max_entradas = opciones.get("MAX_ENTRADAS", 1000)
+        self._ttl_local = opciones.get("TTL_LOCAL", 5)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def compartida(self):
+        return caches[self._alias_compartida]
+
+    def _leer_local(self, key, version):
+        with self._lock:
+            entrada = self._local.get((key, version))
+            if entrada is None:
+                return _FALTA
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._local[(key, version)]
+                return _FALTA
+            self._local.move_to_end((key, version))
+        return pickle.loads(valor)
+
+    def _escribir_local(self, key, valor, timeout, version):
+        ttl = self._ttl_local
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        with self._lock:
+            if ttl <= 0:
+                self._local.pop((key, version), None)
+                return
+            self._local[(key, version)] = (
+                time.monotonic() + ttl,
+                pickle.dumps(valor, pickle.HIGHEST_PROTOCOL),
+            )
+            self._local.move_to_end((key, version))
+            while len(self._local) > self._max_entradas:
+                self._local.popitem(last=False)
+
+    def _borrar_local(self, key, version):
+        with self._lock:
+            self._local.pop((key, version), None)
+
+    def get(self, key, default=None, version=None):
+        valor = self._leer_local(key, version)
+        if valor is not _FALTA:
+            return valor
+        valor = self.compartida.get(key, _FALTA, version=version)
+        if valor is _FALTA:
+            return default
+        self._escribir_local(key, valor, DEFAULT_TIMEOUT, version)
+        return valor
+
+    def get_many(self, keys, version=None):
+        encontrados = {}
+        faltantes = []
+        for key in keys:
+            valor = self._leer_local(key, version)
+            if valor is _FALTA:
+                faltantes.append(key)
+            else:
+                encontrados[key] = valor
+        if faltantes:
+            compartidos = self.compartida.get_many(faltantes, version=version)
+            for key, valor in compartidos.items():
+                self._escribir_local(key, valor, DEFAULT_TIMEOUT, version)
+            encontrados.update(compartidos)
+        return encontrados
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.compartida.set(key, value, timeout, version=version)
+        self._escribir_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        fallidas = self.compartida.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            self._escribir_local(key, value, timeout, version)
+        return fallidas
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        agregado = self.compartida.add(key, value, timeout, version=version)
+        if agregado:
+            self._escribir_local(key, value, timeout, version)
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.compartida.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._borrar_local(key, version)
+        return self.compartida.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._borrar_local(key, version)
+        self.compartida.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._leer_local(key, version) is not _FALTA:
+            return True
+        return self.compartida.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._borrar_local(key, version)
+        return self.compartida.incr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.compartida.clear()
+
+
+def cache_compartida():
+    """Nivel compartido de la cache, sin la LRU local del proceso"""
+    if "compartida" in settings.CACHES:
+        return caches["compartida"]
+    return cache
+
+
+def _clave_version(modelo):
+    # Además de modelos se admiten nombres de versiones propias
+    nombre = modelo if isinstance(modelo, str) else modelo._meta.label_lower
+    return f"version:{nombre}"
+
+
+def versiones_modelos(*modelos):
+    """Versión actual de cada modelo, leída siempre del nivel compartido"""
+    compartida = cache_compartida()
+    claves = [_clave_version(modelo) for modelo in modelos]
+    versiones = compartida.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            # Partir de la hora actual evita reutilizar versiones ya vistas
+            # si la clave se perdió por expulsión o reinicio de la cache
+            compartida.add(clave, int(time.time() * 1000), None)
+            versiones[clave] = compartida.get(clave)
+    return tuple(versiones[clave] for clave in claves)
+
+
+def incrementar_version(*modelos):
+    """Invalida todas las entradas cacheadas que dependen de los modelos.
+
+    Devuelve las versiones nuevas, en el mismo orden.
+    """
+    compartida = cache_compartida()
+    versiones = []
+    for modelo in modelos:
+        clave = _clave_version(modelo)
+        try:
+            versiones.append(compartida.incr(clave))
+        except ValueError:
+            compartida.add(clave, int(time.time() * 1000), None)
+            versiones.append(compartida.get(clave))
+    return tuple(versiones)
+
+
+def incrementar_version_al_confirmar(*modelos):
+    """Como incrementar_version, pero tras el commit de la transacción en curso.
+
+    Si la versión cambiara antes, un lector concurrente podría cachear con
+    la versión nueva datos que todavía no ve confirmados.
+    """
+    transaction.on_commit(lambda: incrementar_version(*modelos))
+
+
+def clave_versionada(prefijo, modelos, params=()):
+    """Clave de cache formada por las versiones de los modelos y los parámetros"""
+    version = "-".join(str(v) for v in versiones_modelos(*modelos))
+    firma = hashlib.md5(urlencode(sorted(params)).encode()).hexdigest()
+    return f"{prefijo}:{version}:{firma}"
+
+
+def cachear_por_version(prefijo, modelos, params, construir, timeout=TTL_VERSIONADO):
+    """Devuelve el valor cacheado para (versión de los modelos, parámetros)"""
+    clave = clave_versionada(prefijo, modelos, params)
+    valor = cache.get(clave, _FALTA)
+    if valor is _FALTA:
+        valor = construir()
+        cache.set(clave, valor, timeout)
+    return valor
+
+
+# Segundos que vive un bloque prerenderizado aunque no cambien sus versiones
+TTL_PORTADA = 60 * 15
+
+
+def respuesta_prerenderizada(
+    request, nombre, modelos, construir, renderer_context=None
+):
+    """Sirve el bloque ya renderizado desde cache; si falta lo construye.
+
+    El contenido se guarda por formato de salida y por versión de los
+    `modelos` que muestra: un cambio confirmado lleva a una clave nueva, así
+    que un bloque construido antes del commit nunca se sirve después. El
+    camino caliente son dos lecturas de cache sin consultas ni serializers.
+    Si el tipo aceptado trae parámetros que cambian la salida (como
+    indent=4) se renderiza sin cache para no servírsela a otros clientes.
+    """
+    renderer = request.accepted_renderer
+    media_type = getattr(request, "accepted_media_type", None) or renderer.media_type
+    _, parametros = parse_header_parameters(media_type)
+    cacheable = not set(parametros) - {"q"}
+
+    clave = clave_versionada(f"portada:{nombre}:{renderer.format}", modelos)
+    contenido = cache.get(clave) if cacheable else None
+    if contenido is None:
+        contenido = renderer.render(
+            construir(),
+            media_type,
+            renderer_context or {"request": request},
+        )
+        if cacheable:
+            cache.set(clave, contenido, TTL_PORTADA)
+
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    return HttpResponse(contenido, content_type=content_type)
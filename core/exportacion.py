@@ -0,0 +1,101 @@
+import csv
+
+import orjson
+
+from .models import Libro
+
+# Filas que se leen por viaje al cursor del servidor; cada bloque trae
+# también las categorías de sus libros en una sola consulta
+TAMANO_LOTE = 2000
+
+COLUMNAS = [
+    "id",
+    "isbn",
+    "titulo",
+    "autor",
+    "editorial",
+    "categorias",
+    "anio_publicacion",
+    "numero_paginas",
+    "idioma",
+    "tipo",
+    "descripcion",
+    "portada",
+    "cantidad_total",
+    "cantidad_disponible",
+    "calificacion_promedio",
+    "numero_resenas",
+    "es_popular",
+    "es_nuevo",
+    "fecha_agregado",
+    "fecha_actualizado",
+]
+
+FORMATOS = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def filas_catalogo(queryset=None, tamano_lote=TAMANO_LOTE):
+    """Recorre el catálogo con memoria constante y devuelve un dict por libro"""
+    if queryset is None:
+        queryset = Libro.objects.all()
+    libros = (
+        queryset.select_related("autor", "editorial")
+        .prefetch_related("categorias")
+        .defer("titulo_normalizado", "vector_busqueda")
+        .order_by("pk")
+    )
+    for libro in libros.iterator(chunk_size=tamano_lote):
+        yield {
+            "id": libro.pk,
+            "isbn": libro.isbn,
+            "titulo": libro.titulo,
+            "autor": libro.autor.nombre,
+            "editorial": libro.editorial.nombre if libro.editorial else None,
+            "categorias": [categoria.nombre for categoria in libro.categorias.all()],
+            "anio_publicacion": libro.anio_publicacion,
+            "numero_paginas": libro.numero_paginas,
+            "idioma": libro.idioma,
+            "tipo": libro.tipo,
+            "descripcion": libro.descripcion,
+            "portada": libro.portada.url if libro.portada else None,
+            "cantidad_total": libro.cantidad_total,
+            "cantidad_disponible": libro.cantidad_disponible,
+            "calificacion_promedio": libro.calificacion_promedio,
+            "numero_resenas": libro.numero_resenas,
+            "es_popular": libro.es_popular,
+            "es_nuevo": libro.es_nuevo,
+            "fecha_agregado": libro.fecha_agregado.isoformat(),
+            "fecha_actualizado": libro.fecha_actualizado.isoformat(),
+        }
+
+
+def _linea_json(fila):
+    # Como el renderer de la API: los separadores de línea Unicode se escapan
+    # para que quien parta el archivo con splitlines() no corte un registro
+    linea = orjson.dumps(fila).replace(b"\xe2\x80\xa8", b"\\u2028")
+    return linea.replace(b"\xe2\x80\xa9", b"\\u2029").decode() + "\n"
+
+
+class _Eco:
+    """Pseudo-archivo que devuelve lo escrito para que csv.writer genere líneas"""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_exportacion(formato, queryset=None, tamano_lote=TAMANO_LOTE):
+    """Líneas de texto del catálogo en JSON Lines o CSV (con cabecera)"""
+    filas = filas_catalogo(queryset, tamano_lote)
+    if formato == "jsonl":
+        for fila in filas:
+            yield _linea_json(fila)
+        return
+
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS)
+    for fila in filas:
+        fila["categorias"] = "|".join(fila["categorias"])
+        yield escritor.writerow([fila[columna] for columna in COLUMNAS])
@@ -0,0 +1,102 @@
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Cast
+
+from .cache import cachear_por_version
+from .models import Categoria, Editorial, Libro
+
+# Parámetros de filtrado que afectan al conjunto de libros
+PARAMETROS_FILTRO = [
+    "q",
+    "categoria",
+    "autor",
+    "disponible",
+    "es_popular",
+    "es_nuevo",
+    "anio_desde",
+    "anio_hasta",
+]
+
+# Segundos que se guardan en cache las facetas de un mismo filtro
+TTL_FACETAS = 60
+
+
+def parametros_filtro(query_params):
+    """Filtros presentes en la petición, normalizados y ordenados"""
+    normalizados = []
+    for nombre in PARAMETROS_FILTRO:
+        valor = query_params.get(nombre, "").strip()
+        if valor:
+            if nombre in ("disponible", "es_popular", "es_nuevo"):
+                valor = valor.lower()
+            normalizados.append((nombre, valor))
+    return normalizados
+
+
+def _agrupar(queryset, faceta, valor, etiqueta):
+    return (
+        queryset.annotate(
+            faceta=Value(faceta),
+            valor=Cast(valor, CharField()),
+            etiqueta=Cast(etiqueta, CharField()),
+        )
+        .values("faceta", "valor", "etiqueta")
+        .annotate(total=Count("id"))
+        .values_list("faceta", "valor", "etiqueta", "total")
+    )
+
+
+def calcular_facetas(queryset):
+    """Cuenta libros por categoría, tipo, idioma, editorial y década.
+
+    Las cinco agrupaciones se combinan con UNION ALL para resolverlas en
+    una sola consulta a la base de datos.
+    """
+    base = queryset.select_related(None).prefetch_related(None).order_by()
+    decada = F("anio_publicacion") / 10 * 10
+    consulta = _agrupar(base, "categorias", "categorias__id", "categorias__nombre")
+    consulta = consulta.union(
+        _agrupar(base, "tipos", "tipo", "tipo"),
+        _agrupar(base, "idiomas", "idioma", "idioma"),
+        _agrupar(base, "editoriales", "editorial__id", "editorial__nombre"),
+        _agrupar(base, "decadas", decada, decada),
+        all=True,
+    ).order_by()
+
+    tipos = dict(Libro.TIPO_CHOICES)
+    facetas = {
+        "categorias": [],
+        "tipos": [],
+        "idiomas": [],
+        "editoriales": [],
+        "decadas": [],
+    }
+    for faceta, valor, etiqueta, total in consulta:
+        if valor is None:
+            continue
+        if faceta in ("categorias", "editoriales"):
+            item = {"id": int(valor), "nombre": etiqueta, "total": total}
+        elif faceta == "tipos":
+            item = {"valor": valor, "etiqueta": tipos.get(valor, valor), "total": total}
+        elif faceta == "decadas":
+            item = {"valor": int(valor), "total": total}
+        else:
+            item = {"valor": valor, "total": total}
+        facetas[faceta].append(item)
+
+    for faceta, items in facetas.items():
+        if faceta == "decadas":
+            items.sort(key=lambda item: item["valor"])
+        else:
+            items.sort(key=lambda item: -item["total"])
+    return facetas
+
+
+def facetas_cacheadas(queryset, query_params):
+    """Facetas del filtro actual, cacheadas por versión del catálogo y filtro"""
+    return cachear_por_version(
+        "facetas",
+        [Libro, Categoria, Editorial],
+        parametros_filtro(query_params),
+        lambda: calcular_facetas(queryset),
+        TTL_FACETAS,
+    )
@@ -0,0 +1,443 @@
+import csv
+import json
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .autocompletado import VERSION_INDICE
+from .busqueda import actualizar_vector_busqueda, normalizar
+from .cache import incrementar_version
+from .models import Autor, Categoria, Editorial, Libro
+
+FORMATOS = ["csv", "jsonl", "mrk"]
+
+# Registros por tarea enviada al pool y por transacción de escritura
+TAMANO_BLOQUE = 1000
+TAMANO_LOTE = 2000
+
+TIPOS = {clave for clave, _ in Libro.TIPO_CHOICES}
+
+# Campos que una importación compara y actualiza en libros existentes; los
+# destacados y la portada se gestionan a mano y no se tocan
+CAMPOS_ACTUALIZABLES = [
+    "titulo",
+    "titulo_normalizado",
+    "autor_id",
+    "editorial_id",
+    "anio_publicacion",
+    "numero_paginas",
+    "idioma",
+    "descripcion",
+    "tipo",
+    "cantidad_total",
+]
+
+IDIOMAS_MARC = {
+    "spa": "Español",
+    "eng": "Inglés",
+    "fre": "Francés",
+    "ger": "Alemán",
+    "ita": "Italiano",
+    "por": "Portugués",
+    "cat": "Catalán",
+}
+
+
+# =========================
+# LECTURA (proceso principal)
+# =========================
+def _bloques_csv(archivo):
+    lector = csv.DictReader(archivo)
+    bloque = []
+    for numero, fila in enumerate(lector, start=2):
+        bloque.append((numero, fila))
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def _bloques_lineas(archivo):
+    bloque = []
+    for numero, linea in enumerate(archivo, start=1):
+        if linea.strip():
+            bloque.append((numero, linea))
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def _bloques_mrk(archivo):
+    """Registros MARC en texto (formato .mrk) separados por líneas en blanco"""
+    bloque = []
+    registro = []
+    inicio = 1
+    for numero, linea in enumerate(archivo, start=1):
+        if linea.strip():
+            if not registro:
+                inicio = numero
+            registro.append(linea.rstrip("\n"))
+            continue
+        if registro:
+            bloque.append((inicio, registro))
+            registro = []
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if registro:
+        bloque.append((inicio, registro))
+    if bloque:
+        yield bloque
+
+
+LECTORES = {"csv": _bloques_csv, "jsonl": _bloques_lineas, "mrk": _bloques_mrk}
+
+
+# =========================
+# PARSEO (procesos del pool)
+# =========================
+def _entero(valor, defecto=None):
+    if valor in (None, ""):
+        return defecto
+    coincidencia = re.search(r"-?\d+", str(valor))
+    if coincidencia is None:
+        raise ValueError(f"número no válido: {valor!r}")
+    return int(coincidencia.group())
+
+
+def _texto(valor):
+    return str(valor).strip() if valor is not None else ""
+
+
+def _normalizar_registro(datos):
+    """Valida un registro y lo deja listo para escribirse"""
+    titulo = _texto(datos.get("titulo"))
+    autor = _texto(datos.get("autor"))
+    if not titulo or not autor:
+        raise ValueError("titulo y autor son obligatorios")
+    anio = _entero(datos.get("anio_publicacion"))
+    if anio is None:
+        raise ValueError("anio_publicacion es obligatorio")
+
+    # El ISBN es la clave con la que una nueva importación encuentra el
+    # libro: sin él cada importación volvería a crearlo
+    isbn = re.sub(r"[^0-9Xx]", "", _texto(datos.get("isbn"))).upper()
+    if not isbn:
+        raise ValueError("isbn es obligatorio")
+    if len(isbn) > 13:
+        raise ValueError(f"ISBN demasiado largo: {isbn}")
+
+    categorias = datos.get("categorias") or []
+    if isinstance(categorias, str):
+        categorias = categorias.split("|")
+    categorias = sorted({_texto(c) for c in categorias if _texto(c)})
+
+    tipo = _texto(datos.get("tipo")).lower()
+    cantidad_total = _entero(datos.get("cantidad_total"), 1)
+    return {
+        "isbn": isbn,
+        "titulo": titulo[:300],
+        "titulo_normalizado": normalizar(titulo[:300]),
+        "autor": autor[:200],
+        "editorial": _texto(datos.get("editorial"))[:200] or None,
+        "categorias": [c[:100] for c in categorias],
+        "anio_publicacion": anio,
+        "numero_paginas": _entero(datos.get("numero_paginas")),
+        "idioma": _texto(datos.get("idioma"))[:50] or "Español",
+        "descripcion": _texto(datos.get("descripcion")),
+        "tipo": tipo if tipo in TIPOS else "otro",
+        "cantidad_total": max(cantidad_total, 0),
+    }
+
+
+def _subcampos(contenido):
+    """Pares (código, valor) de un campo de datos MARC en texto"""
+    return [(parte[0], parte[1:]) for parte in contenido[2:].split("$")[1:] if parte]
+
+
+def _limpiar_marc(valor):
+    return valor.strip().rstrip(" /:;,.").strip()
+
+
+def _registro_marc(lineas):
+    """Convierte un registro .mrk en el dict que usan CSV y JSON Lines"""
+    datos = {"categorias": []}
+    for linea in lineas:
+        if not linea.startswith("=") or len(linea) < 6:
+            continue
+        etiqueta, contenido = linea[1:4], linea[6:]
+        if etiqueta == "008" and len(contenido) >= 38:
+            datos.setdefault("idioma", IDIOMAS_MARC.get(contenido[35:38]))
+            continue
+        subcampos = _subcampos(contenido)
+        valores = {}
+        for codigo, valor in subcampos:
+            valores.setdefault(codigo, valor)
+
+        if etiqueta == "020" and valores.get("a", "").strip():
+            datos.setdefault("isbn", valores["a"].split()[0])
+        elif etiqueta in ("100", "110") and "a" in valores:
+            nombre = _limpiar_marc(valores["a"])
+            # "Apellidos, Nombre" -> "Nombre Apellidos"
+            if nombre.count(",") == 1:
+                apellidos, nombre_pila = nombre.split(",")
+                nombre = f"{nombre_pila.strip()} {apellidos.strip()}"
+            datos["autor"] = nombre
+        elif etiqueta == "245" and "a" in valores:
+            titulo = _limpiar_marc(valores["a"])
+            if "b" in valores:
+                titulo = f"{titulo}: {_limpiar_marc(valores['b'])}"
+            datos["titulo"] = titulo
+        elif etiqueta in ("260", "264"):
+            if "b" in valores:
+                datos.setdefault("editorial", _limpiar_marc(valores["b"]))
+            if "c" in valores:
+                datos.setdefault("anio_publicacion", valores["c"])
+        elif etiqueta == "300" and "a" in valores:
+            datos["numero_paginas"] = valores["a"]
+        elif etiqueta == "041" and "a" in valores:
+            datos["idioma"] = IDIOMAS_MARC.get(valores["a"][:3], valores["a"][:3])
+        elif etiqueta == "520" and "a" in valores:
+            datos["descripcion"] = valores["a"].strip()
+        elif etiqueta in ("650", "655") and "a" in valores:
+            datos["categorias"].append(_limpiar_marc(valores["a"]))
+    return datos
+
+
+def parsear_bloque(formato, bloque):
+    """Devuelve (registros válidos, errores) de un bloque de entradas crudas"""
+    registros = []
+    errores = []
+    for numero, entrada in bloque:
+        try:
+            if formato == "jsonl":
+                datos = json.loads(entrada)
+            elif formato == "mrk":
+                datos = _registro_marc(entrada)
+            else:
+                datos = entrada
+            if not isinstance(datos, dict):
+                raise ValueError("se esperaba un objeto por registro")
+            registros.append(_normalizar_registro(datos))
+        except ValueError as exc:
+            errores.append((numero, str(exc)))
+    return registros, errores
+
+
+def _bloques_parseados(formato, archivo, procesos):
+    """Parsea en paralelo manteniendo el orden y como mucho 2 bloques por proceso"""
+    bloques = LECTORES[formato](archivo)
+    if procesos <= 1:
+        for bloque in bloques:
+            yield parsear_bloque(formato, bloque)
+        return
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=django.setup) as pool:
+        pendientes = deque()
+        for bloque in bloques:
+            pendientes.append(pool.submit(parsear_bloque, formato, bloque))
+            if len(pendientes) >= procesos * 2:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+
+# =========================
+# ESCRITURA (proceso principal)
+# =========================
+def _ids_por_nombre(modelo, nombres, campos_extra=None):
+    """Resuelve nombres a ids creando en bloque los que no existen"""
+    nombres = set(nombres)
+    if not nombres:
+        return {}
+    ids = {}
+    for pk, nombre in (
+        modelo.objects.filter(nombre__in=nombres)
+        .order_by("pk")
+        .values_list("pk", "nombre")
+    ):
+        ids.setdefault(nombre, pk)
+    nuevos = [
+        modelo(nombre=nombre, **(campos_extra(nombre) if campos_extra else {}))
+        for nombre in sorted(nombres - ids.keys())
+    ]
+    if nuevos:
+        # ignore_conflicts cubre nombres únicos creados a la vez por otro proceso
+        modelo.objects.bulk_create(nuevos, ignore_conflicts=True)
+        for pk, nombre in modelo.objects.filter(
+            nombre__in=[objeto.nombre for objeto in nuevos]
+        ).values_list("pk", "nombre"):
+            ids.setdefault(nombre, pk)
+    return ids
+
+
+def _actualizar_libros(actualizados, ahora):
+    """Un UPDATE por libro enviado en bloque con executemany.
+
+    bulk_update arma un CASE por campo y fila cuyo coste en Python crece
+    con el lote; executemany de psycopg envía las sentencias en pipeline.
+    """
+    if not actualizados:
+        return
+    tabla = connection.ops.quote_name(Libro._meta.db_table)
+    asignaciones = ", ".join(
+        f"{connection.ops.quote_name(Libro._meta.get_field(campo).column)} = %s"
+        for campo in CAMPOS_ACTUALIZABLES
+    )
+    # Los ejemplares prestados siguen prestados: solo se suma o resta la
+    # diferencia de ejemplares totales
+    sql = (
+        f"UPDATE {tabla} SET {asignaciones}, "
+        "cantidad_disponible = GREATEST(cantidad_disponible + %s, 0), "
+        "fecha_actualizado = %s WHERE id = %s"
+    )
+    parametros = [
+        [campos[campo] for campo in CAMPOS_ACTUALIZABLES]
+        + [campos["cantidad_total"] - libro.cantidad_total, ahora, libro.pk]
+        for libro, campos in actualizados
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, parametros)
+
+
+def guardar_lote(registros):
+    """Inserta o actualiza un lote de libros por ISBN en una transacción.
+
+    Los libros existentes cuyos datos y categorías no cambian no se
+    reescriben. Devuelve (creados, actualizados, sin cambios).
+    """
+    # Un ISBN repetido dentro del lote se queda con su última aparición
+    por_isbn = {registro["isbn"]: registro for registro in registros}
+    registros = list(por_isbn.values())
+
+    Relacion = Libro.categorias.through
+    with transaction.atomic():
+        autores = _ids_por_nombre(
+            Autor,
+            (r["autor"] for r in registros),
+            lambda nombre: {"nombre_normalizado": normalizar(nombre)},
+        )
+        editoriales = _ids_por_nombre(
+            Editorial, (r["editorial"] for r in registros if r["editorial"])
+        )
+        categorias = _ids_por_nombre(
+            Categoria, (c for r in registros for c in r["categorias"])
+        )
+        existentes = {
+            libro.isbn: libro
+            for libro in Libro.objects.filter(isbn__in=por_isbn.keys())
+            .only("isbn", *CAMPOS_ACTUALIZABLES)
+            .select_for_update()
+        }
+        categorias_actuales = {}
+        for libro_id, categoria_id in Relacion.objects.filter(
+            libro_id__in=[libro.pk for libro in existentes.values()]
+        ).values_list("libro_id", "categoria_id"):
+            categorias_actuales.setdefault(libro_id, set()).add(categoria_id)
+
+        nuevos = []
+        actualizados = []
+        sin_cambios = 0
+        relaciones = []
+        for registro in registros:
+            campos = {
+                "titulo": registro["titulo"],
+                "titulo_normalizado": registro["titulo_normalizado"],
+                "autor_id": autores[registro["autor"]],
+                "editorial_id": editoriales.get(registro["editorial"]),
+                "anio_publicacion": registro["anio_publicacion"],
+                "numero_paginas": registro["numero_paginas"],
+                "idioma": registro["idioma"],
+                "descripcion": registro["descripcion"],
+                "tipo": registro["tipo"],
+                "cantidad_total": registro["cantidad_total"],
+            }
+            ids_categorias = {categorias[nombre] for nombre in registro["categorias"]}
+            libro = existentes.get(registro["isbn"])
+            if libro is None:
+                libro = Libro(
+                    isbn=registro["isbn"],
+                    cantidad_disponible=registro["cantidad_total"],
+                    **campos,
+                )
+                nuevos.append(libro)
+            elif all(getattr(libro, c) == v for c, v in campos.items()) and (
+                categorias_actuales.get(libro.pk, set()) == ids_categorias
+            ):
+                sin_cambios += 1
+                continue
+            else:
+                actualizados.append((libro, campos))
+            relaciones.append((libro, ids_categorias))
+
+        Libro.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+        _actualizar_libros(actualizados, timezone.now())
+        Relacion.objects.filter(
+            libro_id__in=[libro.pk for libro, _ in actualizados]
+        ).delete()
+        Relacion.objects.bulk_create(
+            [
+                Relacion(libro_id=libro.pk, categoria_id=categoria_id)
+                for libro, ids_categorias in relaciones
+                for categoria_id in ids_categorias
+            ],
+            batch_size=TAMANO_LOTE,
+            ignore_conflicts=True,
+        )
+        actualizar_vector_busqueda(
+            Libro.objects.filter(pk__in=[libro.pk for libro, _ in relaciones])
+        )
+    return len(nuevos), len(actualizados), sin_cambios
+
+
+def importar_catalogo(
+    archivo, formato, procesos=1, tamano_lote=TAMANO_LOTE, progreso=None
+):
+    """Importa un catálogo completo y devuelve un resumen de la operación.
+
+    `progreso` se llama tras cada lote con el resumen parcial.
+    """
+    resumen = {
+        "leidos": 0,
+        "creados": 0,
+        "actualizados": 0,
+        "sin_cambios": 0,
+        "errores": [],
+    }
+    inicio = time.monotonic()
+    pendientes = []
+    for registros, errores in _bloques_parseados(formato, archivo, procesos):
+        resumen["leidos"] += len(registros) + len(errores)
+        resumen["errores"].extend(errores)
+        pendientes.extend(registros)
+        while len(pendientes) >= tamano_lote:
+            lote, pendientes = pendientes[:tamano_lote], pendientes[tamano_lote:]
+            _acumular(resumen, guardar_lote(lote), inicio, progreso)
+    if pendientes:
+        _acumular(resumen, guardar_lote(pendientes), inicio, progreso)
+
+    # Los contadores y las versiones de cache (de las que depende también la
+    # portada) se actualizan una sola vez al final porque
+    # bulk_create/bulk_update no disparan signals
+    Autor.recalcular_numero_libros()
+    Categoria.recalcular_numero_libros()
+    incrementar_version(Libro, Autor, Editorial, Categoria, VERSION_INDICE)
+    resumen["segundos"] = time.monotonic() - inicio
+    return resumen
+
+
+def _acumular(resumen, resultado, inicio, progreso):
+    resumen["creados"] += resultado[0]
+    resumen["actualizados"] += resultado[1]
+    resumen["sin_cambios"] += resultado[2]
+    resumen["segundos"] = time.monotonic() - inicio
+    if progreso is not None:
+        progreso(resumen)
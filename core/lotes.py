@@ -0,0 +1,193 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .autocompletado import VERSION_INDICE
+from .busqueda import actualizar_vector_busqueda, normalizar
+from .cache import incrementar_version
+from .models import Autor, Categoria, Editorial, Libro
+from .serializers import LibroLoteSerializer
+
+# Libros aceptados por petición en el endpoint de lotes
+LOTE_MAXIMO = 500
+
+
+def _existentes(modelo, ids):
+    """Ids que existen de entre los indicados, con una sola consulta IN"""
+    if not ids:
+        return set()
+    return set(modelo.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def _validar(datos):
+    """Valida cada elemento por separado; devuelve (validados, errores)"""
+    validados = {}
+    errores = {}
+    for indice, elemento in enumerate(datos):
+        if not isinstance(elemento, dict):
+            errores[indice] = {"non_field_errors": ["Se esperaba un objeto."]}
+            continue
+        serializer = LibroLoteSerializer(data=elemento, partial="id" in elemento)
+        if serializer.is_valid():
+            validados[indice] = serializer.validated_data
+        else:
+            errores[indice] = serializer.errors
+    return validados, errores
+
+
+def _validar_relaciones(validados, errores):
+    """Comprueba ids relacionados e ISBN de todo el lote con una consulta por modelo"""
+    autores = _existentes(
+        Autor, {d["autor_id"] for d in validados.values() if "autor_id" in d}
+    )
+    editoriales = _existentes(
+        Editorial,
+        {d["editorial_id"] for d in validados.values() if d.get("editorial_id")},
+    )
+    categorias = _existentes(
+        Categoria, {c for d in validados.values() for c in d.get("categoria_ids", [])}
+    )
+    libros = {
+        libro.pk: libro
+        for libro in Libro.objects.filter(
+            pk__in=[d["id"] for d in validados.values() if "id" in d]
+        ).select_for_update()
+    }
+
+    isbns = {d["isbn"] for d in validados.values() if d.get("isbn")}
+    isbn_ocupados = dict(Libro.objects.filter(isbn__in=isbns).values_list("isbn", "pk"))
+    isbn_lote = set()
+
+    for indice, datos in list(validados.items()):
+        error = {}
+        if "id" in datos and datos["id"] not in libros:
+            error["id"] = [f'El libro "{datos["id"]}" no existe.']
+        if "autor_id" in datos and datos["autor_id"] not in autores:
+            error["autor_id"] = [f'El autor "{datos["autor_id"]}" no existe.']
+        if datos.get("editorial_id") and datos["editorial_id"] not in editoriales:
+            error["editorial_id"] = [
+                f'La editorial "{datos["editorial_id"]}" no existe.'
+            ]
+        faltantes = [c for c in datos.get("categoria_ids", []) if c not in categorias]
+        if faltantes:
+            error["categoria_ids"] = [
+                f'La categoría "{categoria}" no existe.' for categoria in faltantes
+            ]
+        isbn = datos.get("isbn")
+        if isbn:
+            if isbn in isbn_lote:
+                error["isbn"] = ["ISBN repetido dentro del lote."]
+            elif isbn_ocupados.get(isbn, datos.get("id")) != datos.get("id"):
+                error["isbn"] = ["Ya existe un libro con este ISBN."]
+            isbn_lote.add(isbn)
+        if error:
+            errores[indice] = error
+            del validados[indice]
+    return libros
+
+
+def guardar_libros(datos):
+    """Crea o actualiza (si traen `id`) una lista de libros en una transacción.
+
+    Los elementos inválidos no impiden guardar el resto. Devuelve un
+    resultado por elemento, en el orden recibido.
+    """
+    validados, errores = _validar(datos)
+    Relacion = Libro.categorias.through
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        libros = _validar_relaciones(validados, errores)
+
+        # Autores y categorías cuyos contadores cambian: los de antes y los de
+        # después de guardar
+        autores_afectados = {libro.autor_id for libro in libros.values()}
+        nuevos = {}
+        actualizados = {}
+        campos_actualizados = set()
+        categorias = {}
+        for indice, campos in validados.items():
+            campos = dict(campos)
+            ids_categorias = campos.pop("categoria_ids", None)
+            if campos.get("isbn") == "":
+                campos["isbn"] = None
+            libro = libros.get(campos.pop("id", None))
+            if libro is None:
+                libro = Libro(**campos)
+                nuevos[indice] = libro
+            else:
+                for campo, valor in campos.items():
+                    setattr(libro, campo, valor)
+                campos_actualizados.update(campos)
+                actualizados[indice] = libro
+            libro.titulo_normalizado = normalizar(libro.titulo)
+            if ids_categorias is not None:
+                categorias[indice] = ids_categorias
+
+        autores_afectados.update(libro.autor_id for libro in nuevos.values())
+        autores_afectados.update(libro.autor_id for libro in actualizados.values())
+        ids_reemplazados = [
+            actualizados[indice].pk for indice in categorias if indice in actualizados
+        ]
+        categorias_afectadas = set(
+            Relacion.objects.filter(libro_id__in=ids_reemplazados).values_list(
+                "categoria_id", flat=True
+            )
+        )
+        categorias_afectadas.update(c for ids in categorias.values() for c in ids)
+
+        Libro.objects.bulk_create(nuevos.values())
+        if actualizados:
+            for libro in actualizados.values():
+                libro.fecha_actualizado = ahora
+            Libro.objects.bulk_update(
+                actualizados.values(),
+                sorted(
+                    campos_actualizados | {"titulo_normalizado", "fecha_actualizado"}
+                ),
+            )
+        Relacion.objects.filter(libro_id__in=ids_reemplazados).delete()
+        Relacion.objects.bulk_create(
+            [
+                Relacion(
+                    libro_id=(nuevos.get(indice) or actualizados[indice]).pk,
+                    categoria_id=categoria_id,
+                )
+                for indice, ids_categorias in categorias.items()
+                for categoria_id in set(ids_categorias)
+            ]
+        )
+
+        guardados = [libro.pk for libro in nuevos.values()]
+        guardados.extend(libro.pk for libro in actualizados.values())
+        if guardados:
+            actualizar_vector_busqueda(Libro.objects.filter(pk__in=guardados))
+            # bulk_create/bulk_update no disparan signals
+            Autor.recalcular_numero_libros(
+                Autor.objects.filter(pk__in=autores_afectados)
+            )
+            Categoria.recalcular_numero_libros(
+                Categoria.objects.filter(pk__in=categorias_afectadas)
+            )
+            transaction.on_commit(_invalidar_cache)
+
+    resultados = []
+    for indice in range(len(datos)):
+        if indice in errores:
+            resultados.append({"indice": indice, "errores": errores[indice]})
+        elif indice in nuevos:
+            resultados.append(
+                {"indice": indice, "id": nuevos[indice].pk, "estado": "creado"}
+            )
+        else:
+            resultados.append(
+                {
+                    "indice": indice,
+                    "id": actualizados[indice].pk,
+                    "estado": "actualizado",
+                }
+            )
+    return resultados
+
+
+def _invalidar_cache():
+    incrementar_version(Libro, Autor, Editorial, Categoria, VERSION_INDICE)
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Prestamo
+
+
+class Command(BaseCommand):
+    help = (
+        "Avisa a los usuarios de los préstamos que vencen en los próximos días; "
+        "pensado para ejecutarse periódicamente (cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=settings.DIAS_AVISO_VENCIMIENTO,
+            help="Días de antelación del aviso",
+        )
+        parser.add_argument(
+            "--lote", type=int, default=5000, help="Préstamos por transacción"
+        )
+
+    def handle(self, *args, **options):
+        # Fecha fija para que la ventana no se desplace durante la ejecución
+        ahora = timezone.now()
+        inicio = time.monotonic()
+        total = 0
+        while avisados := Prestamo.enviar_recordatorios(
+            options["dias"], ahora, options["lote"]
+        ):
+            total += avisados
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{total} préstamos avisados...")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} recordatorios de vencimiento enviados en "
+                f"{time.monotonic() - inicio:.1f} s"
+            )
+        )
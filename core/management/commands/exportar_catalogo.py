@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.exportacion import FORMATOS, TAMANO_LOTE, lineas_exportacion
+
+
+class Command(BaseCommand):
+    help = "Exporta el catálogo completo de libros en JSON Lines o CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formato", choices=list(FORMATOS), default="jsonl")
+        parser.add_argument(
+            "--salida", help="Archivo de destino; por defecto la salida estándar"
+        )
+        parser.add_argument("--lote", type=int, default=TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        lineas = lineas_exportacion(options["formato"], tamano_lote=options["lote"])
+        if not options["salida"]:
+            for linea in lineas:
+                self.stdout.write(linea, ending="")
+            return
+
+        total = 0
+        with open(options["salida"], "w", encoding="utf-8", newline="") as archivo:
+            for linea in lineas:
+                archivo.write(linea)
+                total += 1
+        if options["formato"] == "csv":
+            total -= 1  # cabecera
+        self.stdout.write(
+            self.style.SUCCESS(f"{total} libros exportados a {options['salida']}")
+        )
@@ -0,0 +1,76 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacion import FORMATOS, TAMANO_LOTE, importar_catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa libros desde CSV, JSON Lines o MARC en texto (.mrk), creando o "
+        "actualizando por ISBN; los registros sin ISBN se rechazan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument(
+            "--formato",
+            choices=FORMATOS,
+            help="Por defecto se deduce de la extensión del archivo",
+        )
+        parser.add_argument(
+            "--procesos",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Procesos para parsear; 1 parsea en el proceso principal",
+        )
+        parser.add_argument("--lote", type=int, default=TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        formato = options["formato"]
+        if formato is None:
+            formato = os.path.splitext(options["archivo"])[1].lstrip(".").lower()
+            if formato not in FORMATOS:
+                raise CommandError(
+                    f"No se reconoce el formato; usa --formato ({', '.join(FORMATOS)})"
+                )
+
+        try:
+            with open(options["archivo"], encoding="utf-8", newline="") as archivo:
+                resumen = importar_catalogo(
+                    archivo,
+                    formato,
+                    procesos=options["procesos"],
+                    tamano_lote=options["lote"],
+                    progreso=self._progreso,
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for numero, error in resumen["errores"][:20]:
+            self.stderr.write(f"Registro en línea {numero}: {error}")
+        if len(resumen["errores"]) > 20:
+            self.stderr.write(f"... y {len(resumen['errores']) - 20} errores más")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{resumen['creados']} libros creados, "
+                f"{resumen['actualizados']} actualizados, "
+                f"{resumen['sin_cambios']} sin cambios, "
+                f"{len(resumen['errores'])} rechazados en "
+                f"{resumen['segundos']:.1f} s "
+                f"({self._por_segundo(resumen):.0f} filas/s)"
+            )
+        )
+
+    @staticmethod
+    def _por_segundo(resumen):
+        return resumen["leidos"] / resumen["segundos"] if resumen["segundos"] else 0
+
+    def _progreso(self, resumen):
+        procesados = (
+            resumen["creados"] + resumen["actualizados"] + resumen["sin_cambios"]
+        )
+        self.stdout.write(
+            f"{procesados} libros procesados de {resumen['leidos']} leídos "
+            f"({self._por_segundo(resumen):.0f} filas/s)"
+        )
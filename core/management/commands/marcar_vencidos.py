@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Prestamo
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca como vencidos los préstamos activos fuera de plazo y notifica a "
+        "sus usuarios; pensado para ejecutarse periódicamente (cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote", type=int, default=5000, help="Préstamos por transacción"
+        )
+
+    def handle(self, *args, **options):
+        # Fecha fija para que el barrido termine aunque pasen préstamos a
+        # estar vencidos mientras se ejecuta
+        ahora = timezone.now()
+        inicio = time.monotonic()
+        total = 0
+        while marcados := Prestamo.marcar_vencidos(ahora, options["lote"]):
+            total += marcados
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{total} préstamos marcados...")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} préstamos marcados como vencidos en "
+                f"{time.monotonic() - inicio:.1f} s"
+            )
+        )
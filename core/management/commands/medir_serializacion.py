@@ -0,0 +1,112 @@
+import io
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from djangorestframework_camel_case.parser import CamelCaseJSONParser
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from core.models import Libro, Prestamo
+from core.renderers import (
+    CamelCaseCBORRenderer,
+    CamelCaseMessagePackRenderer,
+    CamelCaseORJSONParser,
+    CamelCaseORJSONRenderer,
+    cbor2,
+    msgpack,
+    orjson,
+)
+from core.serializers import LibroListSerializer, PrestamoSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el renderer y el parser camelCase originales con los basados "
+        "en orjson, y el tamaño y tiempo de JSON frente a MessagePack y CBOR, "
+        "sobre páginas de LibroListSerializer y PrestamoSerializer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--libros", type=int, default=100)
+        parser.add_argument("--repeticiones", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson no está instalado")
+
+        datos = self._pagina(
+            LibroListSerializer,
+            Libro.objects.select_related("autor").prefetch_related("categorias"),
+            options["libros"],
+        )
+        if datos is None:
+            raise CommandError("No hay libros en el catálogo")
+
+        original = CamelCaseJSONRenderer().render(datos)
+        rapido = CamelCaseORJSONRenderer().render(datos)
+        if original != rapido:
+            raise CommandError("Las salidas de ambos renderers no coinciden")
+
+        repeticiones = options["repeticiones"]
+        self.stdout.write(f"{len(datos)} libros, {len(original)} bytes")
+        self._comparar(
+            "render",
+            lambda renderer: renderer.render(datos),
+            CamelCaseJSONRenderer(),
+            CamelCaseORJSONRenderer(),
+            repeticiones,
+        )
+        self._comparar(
+            "parse",
+            lambda parser: parser.parse(io.BytesIO(original)),
+            CamelCaseJSONParser(),
+            CamelCaseORJSONParser(),
+            repeticiones,
+        )
+
+        prestamos = self._pagina(
+            PrestamoSerializer,
+            Prestamo.objects.select_related("usuario", "libro__autor").prefetch_related(
+                "libro__categorias"
+            ),
+            options["libros"],
+        )
+        renderers = [CamelCaseORJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(CamelCaseMessagePackRenderer())
+        if cbor2 is not None:
+            renderers.append(CamelCaseCBORRenderer())
+        for nombre, pagina in (("libros", datos), ("préstamos", prestamos)):
+            if pagina is None:
+                self.stdout.write(f"{nombre}: no hay datos")
+                continue
+            for renderer in renderers:
+                tamano = len(renderer.render(pagina))
+                tiempo = timeit.timeit(
+                    lambda: renderer.render(pagina), number=repeticiones
+                )
+                self.stdout.write(
+                    f"{nombre} {renderer.format}: {tamano} bytes, "
+                    f"{tiempo * 1000 / repeticiones:.3f} ms"
+                )
+
+    def _pagina(self, serializer_class, queryset, cantidad):
+        """Datos serializados de `cantidad` objetos, repitiendo si hay menos"""
+        objetos = list(queryset[:cantidad])
+        if not objetos:
+            return None
+        objetos = (objetos * (cantidad // len(objetos) + 1))[:cantidad]
+        serializer = serializer_class(objetos, many=True)
+        return ReturnList(serializer.data, serializer=serializer)
+
+    def _comparar(self, nombre, operacion, original, rapido, repeticiones):
+        antes, despues = (
+            timeit.timeit(lambda: operacion(objeto), number=repeticiones)
+            * 1000
+            / repeticiones
+            for objeto in (original, rapido)
+        )
+        self.stdout.write(
+            f"{nombre}: original {antes:.3f} ms, orjson {despues:.3f} ms "
+            f"({antes / despues:.1f}x)"
+        )
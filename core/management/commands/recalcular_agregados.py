@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import incrementar_version
+from core.models import Autor, Categoria, Libro
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde cero los agregados de reseñas de los libros y el "
+        "número de libros de autores y categorías"
+    )
+
+    def handle(self, *args, **options):
+        actualizados = Libro.recalcular_calificaciones()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Calificaciones recalculadas para {actualizados} libros"
+            )
+        )
+        autores = Autor.recalcular_numero_libros()
+        categorias = Categoria.recalcular_numero_libros()
+        incrementar_version(Libro, Autor, Categoria)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Número de libros recalculado para {autores} autores "
+                f"y {categorias} categorías"
+            )
+        )
@@ -0,0 +1,121 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Autor, Libro, Notificacion, Prestamo, Reserva
+
+
+class Command(BaseCommand):
+    help = (
+        "Devuelve a la vez, desde varios hilos, todos los préstamos de un libro "
+        "con reservas pendientes y mide la latencia de la devolución. Crea y "
+        "borra datos de prueba, así que solo se ejecuta con DEBUG activo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prestamos", type=int, default=20)
+        parser.add_argument("--reservas", type=int, default=10)
+        parser.add_argument(
+            "--repeticiones",
+            type=int,
+            default=2,
+            help="Hilos que intentan devolver cada préstamo",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError(
+                "simular_devoluciones escribe en la base de datos; "
+                "ejecútalo solo en desarrollo (DEBUG=True)"
+            )
+        numero_prestamos = options["prestamos"]
+        numero_reservas = options["reservas"]
+        repeticiones = options["repeticiones"]
+        sufijo = uuid.uuid4().hex[:8]
+
+        # Datos temporales que se eliminan al terminar
+        autor = Autor.objects.create(nombre=f"Simulación {sufijo}")
+        libro = Libro.objects.create(
+            titulo=f"Simulación de devoluciones {sufijo}",
+            autor=autor,
+            anio_publicacion=2000,
+            descripcion="",
+            cantidad_total=numero_prestamos,
+            cantidad_disponible=0,
+        )
+        usuarios = [
+            User.objects.create_user(f"simulacion_{sufijo}_{i}")
+            for i in range(numero_prestamos + numero_reservas)
+        ]
+        Prestamo.objects.bulk_create(
+            Prestamo(
+                usuario=usuario,
+                libro=libro,
+                fecha_devolucion_esperada=timezone.now(),
+            )
+            for usuario in usuarios[:numero_prestamos]
+        )
+        Reserva.objects.bulk_create(
+            Reserva(usuario=usuario, libro=libro)
+            for usuario in usuarios[numero_prestamos:]
+        )
+
+        # Cada hilo recibe su propia instancia del préstamo
+        tareas = [
+            prestamo
+            for _ in range(repeticiones)
+            for prestamo in Prestamo.objects.filter(libro=libro).select_related("libro")
+        ]
+        barrera = threading.Barrier(len(tareas))
+
+        def devolver(prestamo):
+            try:
+                barrera.wait()
+                inicio = time.perf_counter()
+                devuelto = prestamo.devolver()
+                return devuelto, time.perf_counter() - inicio
+            finally:
+                connection.close()
+
+        try:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(tareas)) as pool:
+                resultados = list(pool.map(devolver, tareas))
+            segundos = time.perf_counter() - inicio
+
+            libro.refresh_from_db()
+            devueltos = Prestamo.objects.filter(libro=libro, estado="devuelto").count()
+            notificadas = Reserva.objects.filter(
+                libro=libro, estado="notificado"
+            ).count()
+            avisos = Notificacion.objects.filter(
+                usuario__in=usuarios[numero_prestamos:], tipo="reserva"
+            )
+            avisos = avisos.count()
+        finally:
+            libro.delete()
+            autor.delete()
+            User.objects.filter(pk__in=[u.pk for u in usuarios]).delete()
+
+        exitos = sum(1 for devuelto, _ in resultados if devuelto)
+        latencias = sorted(duracion * 1000 for _, duracion in resultados)
+        self.stdout.write(
+            f"{len(tareas)} intentos de devolución en {segundos:.3f} s "
+            f"({len(tareas) / segundos:.0f}/s): {exitos} devoluciones, "
+            f"{devueltos} préstamos devueltos, {libro.cantidad_disponible} "
+            f"disponibles, {notificadas} reservas notificadas, {avisos} avisos"
+        )
+        self.stdout.write(
+            f"Latencia: media {statistics.mean(latencias):.2f} ms, "
+            f"p50 {latencias[len(latencias) // 2]:.2f} ms, "
+            f"p95 {latencias[int(len(latencias) * 0.95) - 1]:.2f} ms, "
+            f"máx {latencias[-1]:.2f} ms"
+        )
@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:35
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def calcular_agregados(apps, schema_editor):
+    Libro = apps.get_model('core', 'Libro')
+    Resena = apps.get_model('core', 'Resena')
+    resenas = Resena.objects.filter(libro=OuterRef('pk')).order_by().values('libro')
+    Libro.objects.update(
+        suma_calificaciones=Coalesce(Subquery(resenas.annotate(total=Sum('calificacion')).values('total')), 0),
+        numero_resenas=Coalesce(Subquery(resenas.annotate(total=Count('id')).values('total')), 0),
+    )
+    Libro.objects.update(
+        calificacion_promedio=Coalesce(
+            Cast(F('suma_calificaciones'), models.FloatField())
+            / NullIf(Cast(F('numero_resenas'), models.FloatField()), 0.0),
+            0.0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_autor_foto_alter_libro_portada_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='calificacion_promedio',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='numero_resenas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='suma_calificaciones',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['-calificacion_promedio'], name='libro_calificacion_idx'),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
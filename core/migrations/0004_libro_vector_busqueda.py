@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_libro_agregados_resenas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='vector_busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vector_busqueda'], name='libro_busqueda_gin'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE core_libro SET vector_busqueda =
+                setweight(to_tsvector('spanish', coalesce(titulo, '') || ' ' || coalesce(isbn, '')), 'A')
+                || setweight(to_tsvector('spanish', coalesce(
+                    (SELECT nombre FROM core_autor WHERE core_autor.id = core_libro.autor_id), ''
+                )), 'B')
+                || setweight(to_tsvector('spanish', coalesce(descripcion, '')), 'C')
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:37
+
+import unicodedata
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def normalizar(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def normalizar_existentes(apps, schema_editor):
+    for modelo, campo in (('Autor', 'nombre'), ('Libro', 'titulo')):
+        Modelo = apps.get_model('core', modelo)
+        destino = f'{campo}_normalizado'
+        lote = []
+        for obj in Modelo.objects.only('pk', campo).iterator(chunk_size=2000):
+            setattr(obj, destino, normalizar(getattr(obj, campo)))
+            lote.append(obj)
+            if len(lote) >= 2000:
+                Modelo.objects.bulk_update(lote, [destino])
+                lote = []
+        if lote:
+            Modelo.objects.bulk_update(lote, [destino])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_libro_vector_busqueda'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='autor',
+            name='nombre_normalizado',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='titulo_normalizado',
+            field=models.CharField(default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(normalizar_existentes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='autor',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nombre_normalizado'], name='autor_nombre_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['titulo_normalizado'], name='libro_titulo_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def contar_libros(apps, schema_editor):
+    Autor = apps.get_model('core', 'Autor')
+    Categoria = apps.get_model('core', 'Categoria')
+    Libro = apps.get_model('core', 'Libro')
+    por_autor = Libro.objects.filter(autor=OuterRef('pk')).order_by().values('autor')
+    Autor.objects.update(
+        numero_libros=Coalesce(Subquery(por_autor.annotate(total=Count('id')).values('total')), 0)
+    )
+    por_categoria = Libro.categorias.through.objects.filter(categoria=OuterRef('pk')).order_by().values('categoria')
+    Categoria.objects.update(
+        numero_libros=Coalesce(Subquery(por_categoria.annotate(total=Count('id')).values('total')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autor',
+            name='numero_libros',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='numero_libros',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(contar_libros, migrations.RunPython.noop),
+    ]
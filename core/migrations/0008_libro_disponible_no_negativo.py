@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 05:11
+
+from django.db import migrations, models
+
+
+def corregir_negativos(apps, schema_editor):
+    Libro = apps.get_model('core', 'Libro')
+    Libro.objects.filter(cantidad_disponible__lt=0).update(cantidad_disponible=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_contadores_libros'),
+    ]
+
+    operations = [
+        migrations.RunPython(corregir_negativos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='libro',
+            constraint=models.CheckConstraint(condition=models.Q(('cantidad_disponible__gte', 0)), name='libro_disponible_no_negativo'),
+        ),
+    ]
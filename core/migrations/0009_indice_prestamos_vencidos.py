@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-17 05:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_libro_disponible_no_negativo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado', 'activo')), fields=['fecha_devolucion_esperada'], name='prestamo_activo_vence_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 05:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indice_prestamos_vencidos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prestamo',
+            name='fecha_recordatorio',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado__in', ['activo', 'renovado']), ('fecha_recordatorio__isnull', True)), fields=['fecha_devolucion_esperada'], name='prestamo_recordatorio_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recordatorio_prestamos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='fecha_actualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
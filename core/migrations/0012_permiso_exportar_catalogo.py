@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-17 05:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_perfil_fecha_actualizado'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='libro',
+            options={'ordering': ['-fecha_agregado'], 'permissions': [('exportar_catalogo', 'Puede exportar el catálogo completo')]},
+        ),
+    ]
@@ -1,30 +1,69 @@
+from collections import Counter, defaultdict
+
 from cloudinary.models import CloudinaryField
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils import timezone
 
+from .cache import incrementar_version
+
 
 class Autor(models.Model):
     nombre = models.CharField(max_length=200)
+    nombre_normalizado = models.CharField(max_length=200, default="", editable=False)
     biografia = models.TextField(blank=True, null=True)
     fecha_nacimiento = models.DateField(blank=True, null=True)
     nacionalidad = models.CharField(max_length=100, blank=True, null=True)
     foto = CloudinaryField("autores", blank=True, null=True)
+    numero_libros = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Autores"
         ordering = ["nombre"]
+        indexes = [
+            GinIndex(
+                fields=["nombre_normalizado"],
+                name="autor_nombre_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def ajustar_numero_libros(cls, ids, delta):
+        """Suma `delta` al contador de libros de los autores indicados"""
+        return cls.objects.filter(pk__in=ids).update(
+            numero_libros=F("numero_libros") + delta
+        )
+
+    @classmethod
+    def recalcular_numero_libros(cls, queryset=None):
+        """Recalcula desde cero el contador de libros de cada autor"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        libros = (
+            Libro.objects.filter(autor=OuterRef("pk"))
+            .order_by()
+            .values("autor")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        return queryset.update(numero_libros=Coalesce(Subquery(libros), 0))
+
 
 class Categoria(models.Model):
     """Modelo para categorías de libros"""
 
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True, null=True)
+    numero_libros = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Categorías"
@@ -33,6 +72,27 @@ class Categoria(models.Model):
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def ajustar_numero_libros(cls, ids, delta):
+        """Suma `delta` al contador de libros de las categorías indicadas"""
+        return cls.objects.filter(pk__in=ids).update(
+            numero_libros=F("numero_libros") + delta
+        )
+
+    @classmethod
+    def recalcular_numero_libros(cls, queryset=None):
+        """Recalcula desde cero el contador de libros de cada categoría"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        libros = (
+            Libro.categorias.through.objects.filter(categoria=OuterRef("pk"))
+            .order_by()
+            .values("categoria")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        return queryset.update(numero_libros=Coalesce(Subquery(libros), 0))
+
 
 class Editorial(models.Model):
     """Modelo para editoriales"""
@@ -64,6 +124,7 @@ class Libro(models.Model):
     ]
 
     titulo = models.CharField(max_length=300)
+    titulo_normalizado = models.CharField(max_length=300, default="", editable=False)
     autor = models.ForeignKey(Autor, on_delete=models.CASCADE, related_name="libros")
     isbn = models.CharField(max_length=13, unique=True, blank=True, null=True)
     editorial = models.ForeignKey(
@@ -93,13 +154,38 @@ class Libro(models.Model):
     es_popular = models.BooleanField(default=False)
     es_nuevo = models.BooleanField(default=False)
 
+    # Agregados de reseñas (mantenidos por signals sobre Resena)
+    suma_calificaciones = models.PositiveIntegerField(default=0, editable=False)
+    numero_resenas = models.PositiveIntegerField(default=0, editable=False)
+    calificacion_promedio = models.FloatField(default=0, editable=False)
+
+    # Vector de búsqueda de texto completo (mantenido por signals)
+    vector_busqueda = SearchVectorField(null=True, editable=False)
+
     class Meta:
         ordering = ["-fecha_agregado"]
         indexes = [
             models.Index(fields=["titulo"]),
             models.Index(fields=["autor"]),
             models.Index(fields=["-fecha_agregado"]),
+            models.Index(
+                fields=["-calificacion_promedio"], name="libro_calificacion_idx"
+            ),
+            GinIndex(fields=["vector_busqueda"], name="libro_busqueda_gin"),
+            GinIndex(
+                fields=["titulo_normalizado"],
+                name="libro_titulo_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(cantidad_disponible__gte=0),
+                name="libro_disponible_no_negativo",
+            ),
         ]
+        # Para las cuentas de servicio que consumen la exportación sin ser staff
+        permissions = [("exportar_catalogo", "Puede exportar el catálogo completo")]
 
     def __str__(self):
         return f"{self.titulo} - {self.autor.nombre}"
@@ -108,17 +194,90 @@ class Libro(models.Model):
     def disponible(self):
         return self.cantidad_disponible > 0
 
-    @property
-    def calificacion_promedio(self):
-        """Calcula el promedio de calificaciones"""
-        resenas = self.resenas.all()
-        if resenas.exists():
-            return resenas.aggregate(models.Avg("calificacion"))["calificacion__avg"]
-        return 0
+    @staticmethod
+    def _promedio(suma, numero):
+        """Expresión SQL del promedio a partir de la suma y el número de reseñas"""
+        return Coalesce(
+            Cast(suma, models.FloatField())
+            / NullIf(Cast(numero, models.FloatField()), 0.0),
+            0.0,
+        )
 
-    @property
-    def numero_resenas(self):
-        return self.resenas.count()
+    @classmethod
+    def ajustar_calificaciones(cls, libro_id, suma, numero):
+        """Aplica un delta a los agregados de reseñas con un único UPDATE"""
+        nueva_suma = F("suma_calificaciones") + suma
+        nuevo_numero = F("numero_resenas") + numero
+        return cls.objects.filter(pk=libro_id).update(
+            suma_calificaciones=nueva_suma,
+            numero_resenas=nuevo_numero,
+            calificacion_promedio=cls._promedio(nueva_suma, nuevo_numero),
+            fecha_actualizado=timezone.now(),
+        )
+
+    @classmethod
+    def descontar_ejemplar(cls, libro_id):
+        """Resta un ejemplar disponible si queda alguno; indica si lo consiguió.
+
+        El UPDATE condicional bloquea la fila hasta el final de la
+        transacción, así que dos préstamos del último ejemplar no pueden
+        tener éxito a la vez.
+        """
+        descontado = cls.objects.filter(pk=libro_id, cantidad_disponible__gt=0).update(
+            cantidad_disponible=F("cantidad_disponible") - 1,
+            fecha_actualizado=timezone.now(),
+        )
+        if descontado:
+            transaction.on_commit(cls._invalidar_disponibilidad)
+        return bool(descontado)
+
+    @classmethod
+    def sumar_ejemplares(cls, cantidades):
+        """Devuelve ejemplares al inventario: {libro_id: cantidad}.
+
+        Los libros que reciben la misma cantidad se actualizan con un único
+        UPDATE, así que un lote de devoluciones suele costar uno o dos.
+        """
+        por_cantidad = defaultdict(list)
+        for libro_id, cantidad in cantidades.items():
+            por_cantidad[cantidad].append(libro_id)
+        ahora = timezone.now()
+        for cantidad, ids in por_cantidad.items():
+            cls.objects.filter(pk__in=ids).update(
+                cantidad_disponible=F("cantidad_disponible") + cantidad,
+                fecha_actualizado=ahora,
+            )
+        transaction.on_commit(cls._invalidar_disponibilidad)
+
+    @classmethod
+    def _invalidar_disponibilidad(cls):
+        # Los UPDATE directos no disparan las signals que invalidan la cache
+        incrementar_version(cls)
+
+    @classmethod
+    def recalcular_calificaciones(cls, queryset=None):
+        """Recalcula desde cero los agregados de reseñas"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        resenas = Resena.objects.filter(libro=OuterRef("pk")).order_by().values("libro")
+        with transaction.atomic():
+            actualizados = queryset.update(
+                suma_calificaciones=Coalesce(
+                    Subquery(
+                        resenas.annotate(total=Sum("calificacion")).values("total")
+                    ),
+                    0,
+                ),
+                numero_resenas=Coalesce(
+                    Subquery(resenas.annotate(total=Count("id")).values("total")), 0
+                ),
+            )
+            queryset.update(
+                calificacion_promedio=cls._promedio(
+                    F("suma_calificaciones"), F("numero_resenas")
+                )
+            )
+        return actualizados
 
 
 class PerfilUsuario(models.Model):
@@ -136,6 +295,9 @@ class PerfilUsuario(models.Model):
     max_prestamos = models.IntegerField(default=3)
     dias_prestamo_default = models.IntegerField(default=14)
 
+    # También cambia al guardar el User (nombre visible en las reseñas)
+    fecha_actualizado = models.DateTimeField(auto_now=True)
+
     class Meta:
         verbose_name_plural = "Perfiles de Usuario"
 
@@ -144,8 +306,8 @@ class PerfilUsuario(models.Model):
 
     @property
     def prestamos_activos(self):
-        """Retorna el número de préstamos activos"""
-        return self.user.prestamos.filter(estado="activo").count()
+        """Retorna el número de préstamos en curso: activos, renovados o vencidos"""
+        return self.user.prestamos.filter(estado__in=Prestamo.ESTADOS_PRESTADO).count()
 
     @property
     def puede_prestar(self):
@@ -163,6 +325,9 @@ class Prestamo(models.Model):
         ("renovado", "Renovado"),
     ]
 
+    # Estados en los que el libro sigue en manos del usuario
+    ESTADOS_PRESTADO = ["activo", "vencido", "renovado"]
+
     usuario = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="prestamos"
     )
@@ -174,6 +339,8 @@ class Prestamo(models.Model):
     renovaciones = models.IntegerField(default=0)
     max_renovaciones = models.IntegerField(default=2)
     notas = models.TextField(blank=True, null=True)
+    # Cuándo se avisó de que el préstamo está por vencer (enviar_recordatorios)
+    fecha_recordatorio = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ["-fecha_prestamo"]
@@ -181,6 +348,24 @@ class Prestamo(models.Model):
             models.Index(fields=["usuario", "estado"]),
             models.Index(fields=["libro", "estado"]),
             models.Index(fields=["-fecha_prestamo"]),
+            models.Index(
+                fields=["usuario", "-fecha_prestamo", "-id"],
+                name="prestamo_usuario_fecha_idx",
+            ),
+            # Préstamos activos por vencimiento, para marcar_vencidos
+            models.Index(
+                fields=["fecha_devolucion_esperada"],
+                condition=models.Q(estado="activo"),
+                name="prestamo_activo_vence_idx",
+            ),
+            # Préstamos en curso aún sin recordatorio, para enviar_recordatorios
+            models.Index(
+                fields=["fecha_devolucion_esperada"],
+                condition=models.Q(
+                    estado__in=["activo", "renovado"], fecha_recordatorio__isnull=True
+                ),
+                name="prestamo_recordatorio_idx",
+            ),
         ]
 
     def __str__(self):
@@ -196,7 +381,9 @@ class Prestamo(models.Model):
 
     @property
     def esta_vencido(self):
-        """Verifica si el préstamo está vencido"""
+        """Verifica si el préstamo está vencido, esté marcado o no"""
+        if self.estado == "vencido":
+            return True
         return self.dias_restantes < 0 and self.estado == "activo"
 
     def puede_renovar(self):
@@ -215,20 +402,137 @@ class Prestamo(models.Model):
             )
             self.renovaciones += 1
             self.estado = "renovado"
+            # La nueva fecha merece su propio recordatorio
+            self.fecha_recordatorio = None
             self.save()
             return True
         return False
 
     def devolver(self):
-        """Marca el libro como devuelto"""
-        if self.estado in ["activo", "vencido", "renovado"]:
-            self.fecha_devolucion_real = timezone.now()
-            self.estado = "devuelto"
-            self.libro.cantidad_disponible += 1
-            self.libro.save()
-            self.save()
-            return True
-        return False
+        """Marca el libro como devuelto y avisa a la primera reserva pendiente"""
+        ahora = timezone.now()
+        if not Prestamo.devolver_lote([self.pk], ahora):
+            return False
+        self.estado = "devuelto"
+        self.fecha_devolucion_real = ahora
+        self.libro.cantidad_disponible += 1
+        return True
+
+    @classmethod
+    def marcar_vencidos(cls, ahora=None, tamano_lote=5000):
+        """Marca como vencido un lote de préstamos activos fuera de plazo.
+
+        Recorre el índice parcial de préstamos activos por fecha de
+        devolución y salta las filas bloqueadas, así que se puede ejecutar
+        en paralelo. Crea una notificación por usuario y libro vencido y
+        devuelve cuántos préstamos marcó; 0 indica que no quedan.
+        """
+        ahora = ahora or timezone.now()
+        with transaction.atomic():
+            filas = list(
+                cls.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(estado="activo", fecha_devolucion_esperada__lt=ahora)
+                .order_by("fecha_devolucion_esperada")
+                .values_list("pk", "usuario_id", "libro__titulo")[:tamano_lote]
+            )
+            if not filas:
+                return 0
+            cls.objects.filter(pk__in=[fila[0] for fila in filas]).update(
+                estado="vencido"
+            )
+            avisos = dict.fromkeys(
+                (usuario_id, titulo) for _, usuario_id, titulo in filas
+            )
+            Notificacion.objects.bulk_create(
+                Notificacion(
+                    usuario_id=usuario_id,
+                    tipo="vencimiento",
+                    titulo="Préstamo vencido",
+                    mensaje=f'El préstamo del libro "{titulo}" está vencido. Por favor devuélvelo lo antes posible.',
+                )
+                for usuario_id, titulo in avisos
+            )
+        return len(filas)
+
+    @classmethod
+    def enviar_recordatorios(cls, dias, ahora=None, tamano_lote=5000):
+        """Avisa de un lote de préstamos que vencen en los próximos `dias`.
+
+        Recorre por rango el índice parcial de préstamos en curso sin
+        recordatorio y marca fecha_recordatorio para no avisar dos veces.
+        Devuelve cuántos préstamos avisó; 0 indica que no quedan.
+        """
+        ahora = ahora or timezone.now()
+        with transaction.atomic():
+            filas = list(
+                cls.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(
+                    estado__in=["activo", "renovado"],
+                    fecha_recordatorio__isnull=True,
+                    fecha_devolucion_esperada__gte=ahora,
+                    fecha_devolucion_esperada__lt=ahora + timezone.timedelta(days=dias),
+                )
+                .order_by("fecha_devolucion_esperada")
+                .values_list(
+                    "pk", "usuario_id", "libro__titulo", "fecha_devolucion_esperada"
+                )[:tamano_lote]
+            )
+            if not filas:
+                return 0
+            cls.objects.filter(pk__in=[fila[0] for fila in filas]).update(
+                fecha_recordatorio=ahora
+            )
+            Notificacion.objects.bulk_create(
+                Notificacion(
+                    usuario_id=usuario_id,
+                    tipo="vencimiento",
+                    titulo="Préstamo próximo a vencer",
+                    mensaje=f'El préstamo del libro "{titulo}" vence pronto. Fecha límite: {timezone.localtime(fecha).strftime("%d/%m/%Y")}',
+                )
+                for _, usuario_id, titulo, fecha in filas
+            )
+        return len(filas)
+
+    @classmethod
+    def devolver_lote(cls, ids, ahora=None):
+        """Devuelve varios préstamos a la vez y retorna los ids devueltos.
+
+        Todo ocurre en una transacción con consultas por lotes: un UPDATE de
+        los préstamos, uno por cada cantidad distinta de ejemplares
+        devueltos, la promoción de las reservas y un bulk_create de las
+        notificaciones. Los préstamos bloqueados se releen tras esperar, así
+        que uno devuelto a la vez desde dos sitios solo cuenta una vez.
+        """
+        ahora = ahora or timezone.now()
+        with transaction.atomic():
+            filas = list(
+                cls.objects.select_for_update(of=("self",))
+                .filter(pk__in=list(ids), estado__in=cls.ESTADOS_PRESTADO)
+                .order_by("pk")
+                .values_list("pk", "usuario_id", "libro_id", "libro__titulo")
+            )
+            if not filas:
+                return []
+            cls.objects.filter(pk__in=[fila[0] for fila in filas]).update(
+                estado="devuelto", fecha_devolucion_real=ahora
+            )
+
+            cantidades = Counter(libro_id for _, _, libro_id, _ in filas)
+            titulos = {libro_id: titulo for _, _, libro_id, titulo in filas}
+            Libro.sumar_ejemplares(cantidades)
+
+            notificaciones = [
+                Notificacion(
+                    usuario_id=usuario_id,
+                    tipo="devolucion",
+                    titulo="Libro devuelto",
+                    mensaje=f'Has devuelto el libro "{titulo}". ¡Gracias!',
+                )
+                for _, usuario_id, _, titulo in filas
+            ]
+            notificaciones += Reserva.promover_pendientes(cantidades, titulos, ahora)
+            Notificacion.objects.bulk_create(notificaciones)
+        return [fila[0] for fila in filas]
 
 
 class Resena(models.Model):
@@ -247,6 +551,12 @@ class Resena(models.Model):
         verbose_name_plural = "Reseñas"
         unique_together = ["libro", "usuario"]
         ordering = ["-fecha_creacion"]
+        indexes = [
+            models.Index(
+                fields=["libro", "-fecha_creacion", "-id"],
+                name="resena_libro_fecha_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.usuario.username} - {self.libro.titulo} ({self.calificacion}★)"
@@ -262,6 +572,9 @@ class Reserva(models.Model):
         ("cancelado", "Cancelado"),
     ]
 
+    # Días para recoger el libro desde que se avisa de que está disponible
+    DIAS_RECOGIDA = 3
+
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reservas")
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name="reservas")
     fecha_reserva = models.DateTimeField(auto_now_add=True)
@@ -281,6 +594,56 @@ class Reserva(models.Model):
     def __str__(self):
         return f"{self.usuario.username} - {self.libro.titulo}"
 
+    @classmethod
+    def promover_pendientes(cls, cantidades, titulos, ahora):
+        """Pasa a notificadas las reservas pendientes más antiguas de cada libro.
+
+        `cantidades` indica cuántos ejemplares quedan libres por libro. Debe
+        llamarse dentro de una transacción. Todo se resuelve en una sola
+        sentencia: por cada libro un LATERAL toma y bloquea las primeras
+        reservas de su cola y el UPDATE las marca. Las bloqueadas por otra
+        devolución en curso se saltan (SKIP LOCKED), así cada una se
+        promueve una sola vez. Devuelve las notificaciones sin guardar.
+        """
+        if not cantidades:
+            return []
+        tabla = connection.ops.quote_name(cls._meta.db_table)
+        # No se usa ROW_NUMBER(): Postgres no admite FOR UPDATE junto a
+        # funciones de ventana, y bloquear antes toda la cola dejaría sin
+        # reservas a las devoluciones simultáneas del mismo libro
+        sql = (
+            "WITH elegidas AS ("
+            "SELECT r.id FROM unnest(%s::bigint[], %s::integer[]) "
+            "AS c(libro_id, cantidad) CROSS JOIN LATERAL ("
+            f"SELECT id FROM {tabla} WHERE libro_id = c.libro_id "
+            "AND estado = 'pendiente' ORDER BY fecha_reserva, id "
+            "LIMIT c.cantidad FOR UPDATE SKIP LOCKED) r) "
+            f"UPDATE {tabla} SET estado = 'notificado', fecha_notificacion = %s, "
+            f"fecha_expiracion = %s FROM elegidas WHERE {tabla}.id = elegidas.id "
+            f"RETURNING {tabla}.usuario_id, {tabla}.libro_id"
+        )
+        libros = list(cantidades)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                [
+                    libros,
+                    [cantidades[libro_id] for libro_id in libros],
+                    ahora,
+                    ahora + timezone.timedelta(days=cls.DIAS_RECOGIDA),
+                ],
+            )
+            pendientes = cursor.fetchall()
+        return [
+            Notificacion(
+                usuario_id=usuario_id,
+                tipo="reserva",
+                titulo="Libro disponible",
+                mensaje=f'El libro "{titulos[libro_id]}" que reservaste ya está disponible. Tienes {cls.DIAS_RECOGIDA} días para recogerlo.',
+            )
+            for usuario_id, libro_id in pendientes
+        ]
+
 
 class Notificacion(models.Model):
     """Modelo para notificaciones a usuarios"""
@@ -304,6 +667,16 @@ class Notificacion(models.Model):
 
     class Meta:
         ordering = ["-fecha_creacion"]
+        indexes = [
+            models.Index(
+                fields=["usuario", "-fecha_creacion", "-id"],
+                name="notificacion_usuario_idx",
+            ),
+            models.Index(
+                fields=["usuario", "leido", "-fecha_creacion"],
+                name="notificacion_no_leida_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.titulo} - {self.usuario.username}"
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from .models import Autor, Categoria, Editorial, Libro
+from .serializers import AutorSerializer, EditorialSerializer, campos_raiz
+
+# Columnas que necesita el listado; fecha_agregado no se muestra pero la
+# paginación por cursor la usa como orden por defecto
+CAMPOS_LISTADO = [
+    "id",
+    "titulo",
+    "autor__nombre",
+    "anio_publicacion",
+    "portada",
+    "calificacion_promedio",
+    "numero_resenas",
+    "cantidad_disponible",
+    "es_popular",
+    "es_nuevo",
+    "fecha_agregado",
+    "autor_id",
+    "editorial_id",
+]
+
+# Relaciones que se pueden añadir con ?expand=, con una consulta cada una
+EXPANSIONES = {
+    "autor": (Autor, AutorSerializer),
+    "editorial": (Editorial, EditorialSerializer),
+}
+
+
+def valores_listado(queryset, *extra, campos=None):
+    """Queryset de diccionarios con solo las columnas del listado de libros.
+
+    Si `campos` no incluye autor_nombre se evita el JOIN con autores.
+    """
+    columnas = CAMPOS_LISTADO
+    if campos is not None and "autor_nombre" not in campos_raiz(campos):
+        columnas = [c for c in columnas if c != "autor__nombre"]
+    return (
+        queryset.select_related(None).prefetch_related(None).values(*columnas, *extra)
+    )
+
+
+def _categorias_por_libro(ids_libros):
+    """Categorías de cada libro con el mismo formato que CategoriaSerializer"""
+    Relacion = Libro.categorias.through
+    relaciones = list(
+        Relacion.objects.filter(libro_id__in=ids_libros)
+        .order_by(*("categoria__" + campo for campo in Categoria._meta.ordering))
+        .values_list(
+            "libro_id",
+            "categoria_id",
+            "categoria__nombre",
+            "categoria__descripcion",
+            "categoria__numero_libros",
+        )
+    )
+
+    categorias = defaultdict(list)
+    for libro_id, pk, nombre, descripcion, numero_libros in relaciones:
+        categorias[libro_id].append(
+            {
+                "id": pk,
+                "nombre": nombre,
+                "descripcion": descripcion,
+                "numero_libros": numero_libros,
+            }
+        )
+    return categorias
+
+
+def _expandidos(filas, nombre):
+    """Objetos de una relación expandida, serializados y por id"""
+    modelo, serializer = EXPANSIONES[nombre]
+    ids = {fila[f"{nombre}_id"] for fila in filas} - {None}
+    return {
+        objeto.pk: serializer(objeto).data
+        for objeto in modelo.objects.filter(pk__in=ids)
+    }
+
+
+def proyectar_libros(filas, extra=(), campos=None, expandir=()):
+    """Salida de LibroListSerializer construida desde valores_listado().
+
+    Produce exactamente los mismos datos que el serializer sin instanciar
+    modelos ni serializers por fila; `extra` son anotaciones que se copian
+    tal cual después de los campos del listado. `campos` y `expandir` son
+    las rutas de ?fields= y ?expand=; las categorías solo se consultan si
+    se van a mostrar.
+    """
+    filas = list(filas)
+    incluidos = None if campos is None else campos_raiz(campos) | campos_raiz(expandir)
+    categorias = {}
+    if incluidos is None or "categorias" in incluidos:
+        categorias = _categorias_por_libro([fila["id"] for fila in filas])
+    expansiones = {
+        nombre: _expandidos(filas, nombre)
+        for nombre in EXPANSIONES
+        if nombre in campos_raiz(expandir)
+    }
+    resultado = []
+    for fila in filas:
+        portada = fila["portada"]
+        calificacion = fila["calificacion_promedio"]
+        libro = {
+            "id": fila["id"],
+            "titulo": fila["titulo"],
+            "autor_nombre": fila.get("autor__nombre"),
+            "anio_publicacion": fila["anio_publicacion"],
+            "portada": portada.url if portada else None,
+            "calificacion_promedio": (
+                None if calificacion is None else float(calificacion)
+            ),
+            "numero_resenas": fila["numero_resenas"],
+            "categorias": categorias.get(fila["id"], []),
+            "disponible": fila["cantidad_disponible"] > 0,
+            "cantidad_disponible": fila["cantidad_disponible"],
+            "es_popular": fila["es_popular"],
+            "es_nuevo": fila["es_nuevo"],
+        }
+        for nombre, objetos in expansiones.items():
+            libro[nombre] = objetos.get(fila[f"{nombre}_id"])
+        if incluidos is not None:
+            libro = {c: v for c, v in libro.items() if c in incluidos}
+        for campo in extra:
+            libro[campo] = fila[campo]
+        resultado.append(libro)
+    return resultado
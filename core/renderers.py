@@ -0,0 +1,238 @@
+import json
+import math
+from functools import lru_cache
+
+import cbor2
+import msgpack
+import orjson
+from django.conf import settings
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from djangorestframework_camel_case.parser import CamelCaseJSONParser
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from djangorestframework_camel_case.util import (
+    camel_to_underscore,
+    camelize,
+    is_iterable,
+)
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_ESCALARES = (str, int, bool, type(None))
+
+
+@lru_cache(maxsize=4096)
+def _a_camel(clave):
+    """Clave en camelCase, convertida una sola vez por la librería original"""
+    return next(iter(camelize({clave: None})))
+
+
+@lru_cache(maxsize=4096)
+def _a_snake(clave, sin_guion_antes_de_numero):
+    return camel_to_underscore(
+        clave, no_underscore_before_number=sin_guion_antes_de_numero
+    )
+
+
+def _clave_camel(clave):
+    if isinstance(clave, Promise):
+        clave = force_str(clave)
+    if isinstance(clave, str):
+        return _a_camel(clave)
+    return clave
+
+
+def _float(valor):
+    """Floats que orjson escribe distinto: 0.00001 frente a 1e-05 de json.
+
+    NaN e infinito lanzan ValueError para que el renderer use el camino
+    original, que los rechaza o los escribe según STRICT_JSON.
+    """
+    if valor == 0.0 or abs(valor) >= 1e-4:
+        if not math.isfinite(valor):
+            raise ValueError(valor)
+        return valor
+    return orjson.Fragment(json.dumps(valor).encode())
+
+
+def _camelizar(datos, ajustar_float=_float, otro=None):
+    """Equivalente a camelize() que además prepara los floats para orjson.
+
+    `otro` convierte los valores que no son contenedores ni escalares; si
+    no se indica se dejan tal cual para el `default` del codificador.
+    """
+    if isinstance(datos, dict):
+        return {
+            _clave_camel(clave): _camelizar(valor, ajustar_float, otro)
+            for clave, valor in datos.items()
+        }
+    if isinstance(datos, _ESCALARES):
+        return datos
+    if isinstance(datos, float):
+        return ajustar_float(datos)
+    if isinstance(datos, (list, tuple)):
+        return [_camelizar(elemento, ajustar_float, otro) for elemento in datos]
+    if isinstance(datos, Promise):
+        return force_str(datos)
+    if is_iterable(datos):
+        return [_camelizar(elemento, ajustar_float, otro) for elemento in datos]
+    return datos if otro is None else _camelizar(otro(datos), ajustar_float, otro)
+
+
+def _underscorizar(datos, sin_guion_antes_de_numero):
+    """Equivalente a underscoreize() para los tipos que produce un JSON"""
+    if isinstance(datos, dict):
+        return {
+            (
+                _a_snake(clave, sin_guion_antes_de_numero)
+                if isinstance(clave, str)
+                else clave
+            ): _underscorizar(valor, sin_guion_antes_de_numero)
+            for clave, valor in datos.items()
+        }
+    if isinstance(datos, list):
+        return [
+            _underscorizar(elemento, sin_guion_antes_de_numero) for elemento in datos
+        ]
+    return datos
+
+
+class CamelCaseORJSONRenderer(CamelCaseJSONRenderer):
+    """CamelCaseJSONRenderer con orjson y conversión de claves memorizada.
+
+    Produce los mismos bytes que el renderer original. Con sangría pedida,
+    con opciones ignore_* de camelize o con ajustes JSON distintos de los
+    de DRF por defecto usa el renderer original.
+    """
+
+    def _usa_orjson(self, accepted_media_type, renderer_context):
+        opciones = self.json_underscoreize
+        return (
+            not opciones.get("ignore_fields")
+            and not opciones.get("ignore_keys")
+            and self.ensure_ascii is False
+            and self.compact
+            and self.get_indent(accepted_media_type, renderer_context or {}) is None
+        )
+
+    def _default(self, obj):
+        valor = self.encoder_class().default(obj)
+        return _float(valor) if isinstance(valor, float) else valor
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not self._usa_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                _camelizar(data),
+                default=self._default,
+                option=orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except (ValueError, orjson.JSONEncodeError):
+            # NaN, enteros de más de 64 bits y tipos que orjson no admite
+            return super().render(data, accepted_media_type, renderer_context)
+        # Igual que JSONRenderer: escapar los separadores de línea de JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class CamelCaseORJSONParser(CamelCaseJSONParser):
+    """CamelCaseJSONParser con orjson y conversión de claves memorizada"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        opciones = self.json_underscoreize
+        if opciones.get("ignore_fields") or opciones.get("ignore_keys"):
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        contenido = stream.read()
+        try:
+            if encoding.lower().replace("-", "") != "utf8":
+                contenido = contenido.decode(encoding)
+            datos = orjson.loads(contenido)
+        except ValueError:
+            # orjson rechaza NaN/Infinity, que json sí acepta
+            try:
+                if isinstance(contenido, bytes):
+                    contenido = contenido.decode(encoding)
+                datos = json.loads(contenido)
+            except ValueError as exc:
+                raise ParseError("JSON parse error - %s" % str(exc))
+        return _underscorizar(datos, bool(opciones.get("no_underscore_before_number")))
+
+
+class _CamelCaseBinarioRenderer(BaseRenderer):
+    """Base de los renderers binarios: mismas claves y valores que el JSON.
+
+    Fechas, decimales, UUID y demás tipos se convierten antes de codificar
+    con el mismo JSONEncoder de DRF, así que el cliente recibe los mismos
+    valores que en JSON.
+    """
+
+    charset = None
+    render_style = "binary"
+    encoder_class = JSONEncoder
+
+    def codificar(self, datos):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        datos = _camelizar(data, float, self.encoder_class().default)
+        return self.codificar(datos)
+
+
+class _CamelCaseBinarioParser(BaseParser):
+    """Base de los parsers binarios con claves de vuelta a snake_case"""
+
+    def decodificar(self, contenido):
+        raise NotImplementedError
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            datos = self.decodificar(stream.read())
+        except (ValueError, EOFError) as exc:
+            detalle = str(exc) or type(exc).__name__
+            raise ParseError(f"{self.media_type} parse error - {detalle}")
+        opciones = CamelCaseJSONParser.json_underscoreize
+        return _underscorizar(datos, bool(opciones.get("no_underscore_before_number")))
+
+
+class CamelCaseMessagePackRenderer(_CamelCaseBinarioRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+
+    def codificar(self, datos):
+        return msgpack.packb(datos, use_bin_type=True)
+
+
+class CamelCaseMessagePackParser(_CamelCaseBinarioParser):
+    media_type = "application/msgpack"
+
+    def decodificar(self, contenido):
+        return msgpack.unpackb(contenido, raw=False, strict_map_key=False)
+
+
+class CamelCaseCBORRenderer(_CamelCaseBinarioRenderer):
+    media_type = "application/cbor"
+    format = "cbor"
+
+    def codificar(self, datos):
+        return cbor2.dumps(datos)
+
+
+class CamelCaseCBORParser(_CamelCaseBinarioParser):
+    media_type = "application/cbor"
+
+    def decodificar(self, contenido):
+        return cbor2.loads(contenido)
@@ -1,8 +1,14 @@
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from djangorestframework_camel_case.util import camel_to_underscore
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
 from .models import (
     Autor,
@@ -17,9 +23,118 @@ from .models import (
 )
 
 
-class AutorSerializer(serializers.ModelSerializer):
-    numero_libros = serializers.SerializerMethodField()
+def _rutas(request, parametro):
+    valor = request.query_params.get(parametro)
+    if valor is None:
+        return None
+    return {
+        camel_to_underscore(ruta.strip()) for ruta in valor.split(",") if ruta.strip()
+    }
+
+
+def campos_pedidos(request):
+    """Rutas de ?fields= (None si no se indicó) y de ?expand=, en snake_case.
+
+    Admiten la notación camelCase de la API y rutas anidadas con punto,
+    como `libroInfo.titulo`.
+    """
+    if request is None:
+        return None, set()
+    return _rutas(request, "fields"), _rutas(request, "expand") or set()
 
+
+def campos_raiz(rutas):
+    """Primer nivel de cada ruta: `libro_info.titulo` -> `libro_info`"""
+    return {ruta.split(".", 1)[0] for ruta in rutas}
+
+
+def _subrutas(rutas, campo):
+    """Parte de las rutas que corresponde al campo anidado `campo`"""
+    if rutas is None or campo in rutas:
+        return None
+    return {r.split(".", 1)[1] for r in rutas if r.startswith(campo + ".")} or None
+
+
+class CamposDinamicosMixin:
+    """Campos a elegir con ?fields= y campos opcionales con ?expand=.
+
+    Se aplica al serializer que recibe la petición en su contexto; los
+    serializers anidados reciben la parte de las rutas que les toca. Los
+    campos de solo escritura se conservan siempre.
+    """
+
+    # Campos que solo se incluyen si se piden en ?expand=
+    campos_expandibles = {}
+    # Campo -> (select_related, prefetch_related) que necesita
+    relaciones = {}
+    # Campo -> (relación, serializer) de los serializers anidados
+    anidados = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get("context", {}).get("request")
+        if request is not None:
+            campos, expandir = campos_pedidos(request)
+            if campos is not None or expandir:
+                self.restringir_campos(campos, expandir)
+
+    def restringir_campos(self, campos, expandir):
+        for nombre in campos_raiz(expandir):
+            if nombre in self.campos_expandibles and nombre not in self.fields:
+                self.fields[nombre] = self.campos_expandibles[nombre]()
+        if campos is not None:
+            incluidos = campos_raiz(campos) | campos_raiz(expandir)
+            for nombre, campo in list(self.fields.items()):
+                if nombre not in incluidos and not campo.write_only:
+                    self.fields.pop(nombre)
+        for nombre, campo in self.fields.items():
+            hijo = getattr(campo, "child", campo)
+            sub_campos = _subrutas(campos, nombre)
+            sub_expandir = _subrutas(expandir, nombre) or set()
+            if isinstance(hijo, CamposDinamicosMixin) and (
+                sub_campos is not None or sub_expandir
+            ):
+                hijo.restringir_campos(sub_campos, sub_expandir)
+
+    @classmethod
+    def relaciones_necesarias(cls, campos=None, expandir=()):
+        """(select_related, prefetch_related) de los campos que se serializan"""
+        incluidos = (
+            None if campos is None else campos_raiz(campos) | campos_raiz(expandir)
+        )
+        seleccion, precarga = set(), set()
+        for campo, (select, prefetch) in cls.relaciones.items():
+            if campo in cls.campos_expandibles:
+                if campo not in campos_raiz(expandir):
+                    continue
+            elif incluidos is not None and campo not in incluidos:
+                continue
+            seleccion.update(select)
+            precarga.update(prefetch)
+        for campo, (relacion, serializer) in cls.anidados.items():
+            if incluidos is not None and campo not in incluidos:
+                continue
+            select, prefetch = serializer.relaciones_necesarias(
+                _subrutas(campos, campo), _subrutas(expandir, campo) or set()
+            )
+            seleccion.add(relacion)
+            seleccion.update(f"{relacion}__{r}" for r in select)
+            precarga.update(f"{relacion}__{r}" for r in prefetch)
+        return seleccion, precarga
+
+    @classmethod
+    def optimizar_queryset(cls, queryset, campos=None, expandir=()):
+        """Carga solo las relaciones de los campos que se van a serializar"""
+        seleccion, precarga = cls.relaciones_necesarias(campos, expandir)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if seleccion:
+            queryset = queryset.select_related(*sorted(seleccion))
+        if precarga:
+            queryset = queryset.prefetch_related(*sorted(precarga))
+        return queryset
+
+
+class AutorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Autor
         fields = [
@@ -32,20 +147,12 @@ class AutorSerializer(serializers.ModelSerializer):
             "numero_libros",
         ]
 
-    def get_numero_libros(self, obj):
-        return obj.libros.count()
-
 
 class CategoriaSerializer(serializers.ModelSerializer):
-    numero_libros = serializers.SerializerMethodField()
-
     class Meta:
         model = Categoria
         fields = ["id", "nombre", "descripcion", "numero_libros"]
 
-    def get_numero_libros(self, obj):
-        return obj.libros.count()
-
 
 class EditorialSerializer(serializers.ModelSerializer):
     class Meta:
@@ -77,9 +184,20 @@ class ResenaSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class LibroListSerializer(serializers.ModelSerializer):
+class LibroListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simplificado para listados"""
 
+    campos_expandibles = {
+        "autor": lambda: AutorSerializer(read_only=True),
+        "editorial": lambda: EditorialSerializer(read_only=True),
+    }
+    relaciones = {
+        "autor_nombre": (["autor"], []),
+        "categorias": ([], ["categorias"]),
+        "autor": (["autor"], []),
+        "editorial": (["editorial"], []),
+    }
+
     autor_nombre = serializers.CharField(source="autor.nombre", read_only=True)
     calificacion_promedio = serializers.FloatField(read_only=True)
     numero_resenas = serializers.IntegerField(read_only=True)
@@ -110,9 +228,15 @@ class LibroListSerializer(serializers.ModelSerializer):
         ]
 
 
-class LibroDetailSerializer(serializers.ModelSerializer):
+class LibroDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer detallado para vista individual"""
 
+    relaciones = {
+        "autor": (["autor"], []),
+        "editorial": (["editorial"], []),
+        "categorias": ([], ["categorias"]),
+    }
+
     autor = AutorSerializer(read_only=True)
     autor_id = serializers.PrimaryKeyRelatedField(
         queryset=Autor.objects.all(), source="autor", write_only=True
@@ -134,7 +258,64 @@ class LibroDetailSerializer(serializers.ModelSerializer):
     calificacion_promedio = serializers.FloatField(read_only=True)
     numero_resenas = serializers.IntegerField(read_only=True)
     disponible = serializers.BooleanField(read_only=True)
-    resenas = ResenaSerializer(many=True, read_only=True)
+    resenas = serializers.SerializerMethodField()
+    histograma_calificaciones = serializers.SerializerMethodField()
+    resenas_url = serializers.SerializerMethodField()
+
+    CALIFICACIONES = range(1, 6)
+
+    @classmethod
+    def optimizar_queryset(cls, queryset, campos=None, expandir=()):
+        """Precarga además las últimas reseñas y anota el histograma si se piden"""
+        queryset = super().optimizar_queryset(queryset, campos, expandir)
+        incluidos = None if campos is None else campos_raiz(campos)
+        if incluidos is None or "resenas" in incluidos:
+            recientes = Resena.objects.select_related("usuario__perfil").order_by(
+                "-fecha_creacion", "-id"
+            )[: settings.RESENAS_DETALLE_LIMITE]
+            queryset = queryset.prefetch_related(
+                Prefetch("resenas", queryset=recientes, to_attr="resenas_recientes")
+            )
+        if incluidos is not None and "histograma_calificaciones" not in incluidos:
+            return queryset
+        conteos = {
+            f"resenas_{valor}": Coalesce(
+                Subquery(
+                    Resena.objects.filter(libro=OuterRef("pk"), calificacion=valor)
+                    .order_by()
+                    .values("libro")
+                    .annotate(total=Count("id"))
+                    .values("total")
+                ),
+                0,
+            )
+            for valor in cls.CALIFICACIONES
+        }
+        return queryset.annotate(**conteos)
+
+    def get_resenas(self, obj):
+        resenas = getattr(obj, "resenas_recientes", None)
+        if resenas is None:
+            resenas = obj.resenas.select_related("usuario__perfil").order_by(
+                "-fecha_creacion", "-id"
+            )[: settings.RESENAS_DETALLE_LIMITE]
+        return ResenaSerializer(resenas, many=True, context=self.context).data
+
+    def get_histograma_calificaciones(self, obj):
+        if hasattr(obj, "resenas_1"):
+            conteos = {v: getattr(obj, f"resenas_{v}") for v in self.CALIFICACIONES}
+        else:
+            conteos = dict(
+                obj.resenas.order_by()
+                .values("calificacion")
+                .annotate(total=Count("id"))
+                .values_list("calificacion", "total")
+            )
+        return {str(v): conteos.get(v, 0) for v in self.CALIFICACIONES}
+
+    def get_resenas_url(self, obj):
+        url = reverse("resena-list", request=self.context.get("request"))
+        return f"{url}?libro={obj.pk}"
 
     class Meta:
         model = Libro
@@ -160,6 +341,8 @@ class LibroDetailSerializer(serializers.ModelSerializer):
             "calificacion_promedio",
             "numero_resenas",
             "resenas",
+            "histograma_calificaciones",
+            "resenas_url",
             "fecha_agregado",
             "es_popular",
             "es_nuevo",
@@ -167,6 +350,40 @@ class LibroDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ["fecha_agregado", "calificacion_promedio", "numero_resenas"]
 
 
+class LibroLoteSerializer(serializers.ModelSerializer):
+    """Valida un libro de un lote sin consultar la base de datos.
+
+    Los ids relacionados y la unicidad del ISBN se comprueban para todo el
+    lote a la vez en core.lotes.
+    """
+
+    id = serializers.IntegerField(required=False)
+    autor_id = serializers.IntegerField()
+    editorial_id = serializers.IntegerField(required=False, allow_null=True)
+    categoria_ids = serializers.ListField(child=serializers.IntegerField())
+
+    class Meta:
+        model = Libro
+        fields = [
+            "id",
+            "titulo",
+            "autor_id",
+            "isbn",
+            "editorial_id",
+            "anio_publicacion",
+            "numero_paginas",
+            "idioma",
+            "descripcion",
+            "categoria_ids",
+            "tipo",
+            "cantidad_total",
+            "cantidad_disponible",
+            "es_popular",
+            "es_nuevo",
+        ]
+        extra_kwargs = {"isbn": {"validators": []}}
+
+
 class PerfilUsuarioSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source="user.username", read_only=True)
     email = serializers.EmailField(source="user.email", read_only=True)
@@ -235,7 +452,10 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class PrestamoSerializer(serializers.ModelSerializer):
+class PrestamoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    relaciones = {"usuario_nombre": (["usuario"], [])}
+    anidados = {"libro_info": ("libro", LibroListSerializer)}
+
     libro_info = LibroListSerializer(source="libro", read_only=True)
     usuario_nombre = serializers.CharField(source="usuario.username", read_only=True)
     dias_restantes = serializers.IntegerField(read_only=True)
@@ -264,6 +484,7 @@ class PrestamoSerializer(serializers.ModelSerializer):
         read_only_fields = [
             "usuario",
             "fecha_prestamo",
+            "fecha_devolucion_esperada",
             "fecha_devolucion_real",
             "estado",
             "renovaciones",
@@ -280,46 +501,52 @@ class PrestamoSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         usuario = self.context["request"].user
-        libro = validated_data["libro"]
-
-        # Verificar que el usuario pueda realizar préstamos
-        if not usuario.perfil.puede_prestar:
-            raise serializers.ValidationError(
-                "Has alcanzado el límite de préstamos activos o tu cuenta está inactiva"
+        libro = validated_data.pop("libro")
+
+        # Transacción corta: el perfil bloqueado serializa los préstamos
+        # simultáneos del mismo usuario y el UPDATE condicional del libro
+        # impide prestar más ejemplares de los que hay
+        with transaction.atomic():
+            perfil = PerfilUsuario.objects.select_for_update().get(user=usuario)
+
+            # Verificar que el usuario pueda realizar préstamos
+            if not perfil.puede_prestar:
+                raise serializers.ValidationError(
+                    "Has alcanzado el límite de préstamos activos o tu cuenta está inactiva"
+                )
+
+            # Descontar el ejemplar solo si queda alguno disponible
+            if not Libro.descontar_ejemplar(libro.pk):
+                raise serializers.ValidationError("El libro no está disponible")
+
+            # Calcular fecha de devolución
+            dias_prestamo = perfil.dias_prestamo_default
+            fecha_devolucion = timezone.now() + timedelta(days=dias_prestamo)
+
+            # Crear préstamo
+            prestamo = Prestamo.objects.create(
+                usuario=usuario,
+                libro=libro,
+                fecha_devolucion_esperada=fecha_devolucion,
+                **validated_data,
             )
 
-        # Verificar que el libro esté disponible
-        if not libro.disponible:
-            raise serializers.ValidationError("El libro no está disponible")
-
-        # Calcular fecha de devolución
-        dias_prestamo = usuario.perfil.dias_prestamo_default
-        fecha_devolucion = timezone.now() + timedelta(days=dias_prestamo)
-
-        # Crear préstamo
-        prestamo = Prestamo.objects.create(
-            usuario=usuario,
-            libro=libro,
-            fecha_devolucion_esperada=fecha_devolucion,
-            **validated_data,
-        )
+            # Crear notificación
+            Notificacion.objects.create(
+                usuario=usuario,
+                tipo="prestamo",
+                titulo="Préstamo realizado",
+                mensaje=f'Has prestado el libro "{libro.titulo}". Fecha de devolución: {fecha_devolucion.strftime("%d/%m/%Y")}',
+            )
 
-        # Actualizar disponibilidad del libro
         libro.cantidad_disponible -= 1
-        libro.save()
-
-        # Crear notificación
-        Notificacion.objects.create(
-            usuario=usuario,
-            tipo="prestamo",
-            titulo="Préstamo realizado",
-            mensaje=f'Has prestado el libro "{libro.titulo}". Fecha de devolución: {fecha_devolucion.strftime("%d/%m/%Y")}',
-        )
-
         return prestamo
 
 
-class ReservaSerializer(serializers.ModelSerializer):
+class ReservaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    relaciones = {"usuario_nombre": (["usuario"], [])}
+    anidados = {"libro_info": ("libro", LibroListSerializer)}
+
     libro_info = LibroListSerializer(source="libro", read_only=True)
     usuario_nombre = serializers.CharField(source="usuario.username", read_only=True)
 
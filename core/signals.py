@@ -1,11 +1,31 @@
-from datetime import timedelta
-
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
-from django.utils import timezone
 
-from .models import Notificacion, PerfilUsuario, Prestamo, Reserva
+from .autocompletado import indice_autocompletado
+from .busqueda import actualizar_vector_busqueda, normalizar
+from .cache import incrementar_version_al_confirmar
+from .models import (
+    Autor,
+    Categoria,
+    Editorial,
+    Libro,
+    Notificacion,
+    PerfilUsuario,
+    Prestamo,
+    Resena,
+    Reserva,
+)
+
+# Valores previos de un libro que se comparan al guardarlo: el autor mueve
+# los contadores y todos ellos forman el vector de búsqueda
+CAMPOS_ANTERIORES_LIBRO = ("autor_id", "titulo", "isbn", "descripcion")
 
 
 @receiver(post_save, sender=User)
@@ -16,38 +36,184 @@ def crear_perfil_usuario(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def guardar_perfil_usuario(sender, instance, **kwargs):
+def guardar_perfil_usuario(sender, instance, update_fields=None, **kwargs):
     """Guardar perfil cuando se guarde el usuario"""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        # Un inicio de sesión no cambia nada de lo que muestra el perfil
+        return
     if hasattr(instance, "perfil"):
         instance.perfil.save()
 
 
-@receiver(pre_save, sender=Prestamo)
-def actualizar_estado_prestamo(sender, instance, **kwargs):
-    """Actualizar estado de préstamo si está vencido"""
-    if instance.pk:  # Solo para préstamos existentes
-        if instance.estado == "activo" and instance.esta_vencido:
-            instance.estado = "vencido"
-
-            # Crear notificación de vencimiento
-            Notificacion.objects.get_or_create(
-                usuario=instance.usuario,
-                tipo="vencimiento",
-                titulo="Préstamo vencido",
-                mensaje=f'El préstamo del libro "{instance.libro.titulo}" está vencido. Por favor devuélvelo lo antes posible.',
-                defaults={"leido": False},
-            )
+@receiver(pre_save, sender=Resena)
+def recordar_calificacion_anterior(sender, instance, **kwargs):
+    """Guardar la calificación previa para ajustar los agregados del libro"""
+    instance._calificacion_anterior = None
+    if instance.pk:
+        instance._calificacion_anterior = (
+            Resena.objects.filter(pk=instance.pk)
+            .values_list("libro_id", "calificacion")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Resena)
+def actualizar_calificaciones_libro(sender, instance, **kwargs):
+    """Aplicar la reseña creada o editada a los agregados del libro"""
+    anterior = getattr(instance, "_calificacion_anterior", None)
+    if anterior:
+        libro_id, calificacion = anterior
+        if libro_id == instance.libro_id:
+            if calificacion != instance.calificacion:
+                Libro.ajustar_calificaciones(
+                    libro_id, instance.calificacion - calificacion, 0
+                )
+                incrementar_version_al_confirmar(Libro)
+            return
+        Libro.ajustar_calificaciones(libro_id, -calificacion, -1)
+    Libro.ajustar_calificaciones(instance.libro_id, instance.calificacion, 1)
+    incrementar_version_al_confirmar(Libro)
+
+
+@receiver(post_delete, sender=Resena)
+def descontar_calificacion_libro(sender, instance, **kwargs):
+    """Quitar la reseña eliminada de los agregados del libro"""
+    Libro.ajustar_calificaciones(instance.libro_id, -instance.calificacion, -1)
+    incrementar_version_al_confirmar(Libro)
+
+
+@receiver(pre_save, sender=Libro)
+def normalizar_titulo(sender, instance, **kwargs):
+    """Mantener el título sin acentos usado por la búsqueda aproximada"""
+    instance.titulo_normalizado = normalizar(instance.titulo)
+
+
+@receiver(pre_save, sender=Autor)
+def normalizar_nombre_autor(sender, instance, **kwargs):
+    """Mantener el nombre sin acentos usado por la búsqueda aproximada"""
+    instance.nombre_normalizado = normalizar(instance.nombre)
+
+
+@receiver(post_save, sender=Libro)
+def indexar_libro(sender, instance, created, **kwargs):
+    """Recalcular el vector de búsqueda si cambió algún campo indexado"""
+    anterior = getattr(instance, "_libro_anterior", None)
+    actual = tuple(getattr(instance, campo) for campo in CAMPOS_ANTERIORES_LIBRO)
+    if created or anterior != actual:
+        actualizar_vector_busqueda(Libro.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Autor)
+def indexar_libros_autor(sender, instance, created, **kwargs):
+    """Propagar el nombre del autor al vector de búsqueda de sus libros"""
+    if not created:
+        actualizar_vector_busqueda(Libro.objects.filter(autor=instance))
+
+
+@receiver(post_save, sender=Libro)
+def autocompletado_libro(sender, instance, **kwargs):
+    """Actualizar el índice de autocompletado con el libro guardado"""
+    indice_autocompletado.actualizar_libro(instance)
+
+
+@receiver(post_delete, sender=Libro)
+def autocompletado_eliminar_libro(sender, instance, **kwargs):
+    """Quitar del índice de autocompletado el libro eliminado"""
+    indice_autocompletado.eliminar("libro", instance.pk)
+
+
+@receiver(post_save, sender=Autor)
+def autocompletado_autor(sender, instance, **kwargs):
+    """Actualizar el índice de autocompletado con el autor guardado"""
+    indice_autocompletado.actualizar_autor(instance)
+
+
+@receiver(post_delete, sender=Autor)
+def autocompletado_eliminar_autor(sender, instance, **kwargs):
+    """Quitar del índice de autocompletado el autor eliminado"""
+    indice_autocompletado.eliminar("autor", instance.pk)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def incrementar_version_modelo(sender, **kwargs):
+    """Invalidar las entradas cacheadas por versión del modelo modificado"""
+    if sender._meta.app_label == "core":
+        incrementar_version_al_confirmar(sender)
+
+
+@receiver(m2m_changed, sender=Libro.categorias.through)
+def incrementar_version_categorias(sender, action, **kwargs):
+    """Invalidar libros y categorías cuando cambia la relación entre ambos"""
+    if action.startswith("post_"):
+        incrementar_version_al_confirmar(Libro, Categoria)
+
+
+@receiver(pre_save, sender=Libro)
+def recordar_libro_anterior(sender, instance, **kwargs):
+    """Guardar autor y textos indexados previos para compararlos al guardar"""
+    instance._libro_anterior = None
+    if instance.pk:
+        fila = (
+            Libro.objects.filter(pk=instance.pk)
+            .values_list(*CAMPOS_ANTERIORES_LIBRO, "vector_busqueda")
+            .first()
+        )
+        if fila is not None:
+            # save() reescribe el vector: se usa el vigente y no el que se leyó
+            # con la instancia, que otro autor renombrado pudo dejar obsoleto
+            instance._libro_anterior, instance.vector_busqueda = fila[:-1], fila[-1]
+
+
+@receiver(post_save, sender=Libro)
+def contar_libro_autor(sender, instance, created, **kwargs):
+    """Mantener el número de libros del autor al crear o reasignar un libro"""
+    anterior = getattr(instance, "_libro_anterior", None)
+    anterior = anterior and anterior[0]
+    if created:
+        Autor.ajustar_numero_libros([instance.autor_id], 1)
+    elif anterior != instance.autor_id:
+        Autor.ajustar_numero_libros([anterior], -1)
+        Autor.ajustar_numero_libros([instance.autor_id], 1)
+    else:
+        return
+    incrementar_version_al_confirmar(Autor)
+
+
+@receiver(pre_delete, sender=Libro)
+def descontar_libro(sender, instance, **kwargs):
+    """Quitar el libro eliminado de los contadores de su autor y categorías"""
+    Autor.ajustar_numero_libros([instance.autor_id], -1)
+    Categoria.ajustar_numero_libros(
+        list(instance.categorias.values_list("pk", flat=True)), -1
+    )
+    incrementar_version_al_confirmar(Autor, Categoria)
 
 
-@receiver(post_save, sender=Prestamo)
-def notificar_proximo_vencimiento(sender, instance, created, **kwargs):
-    """Notificar cuando faltan 2 días para el vencimiento"""
-    if not created and instance.estado in ["activo", "renovado"]:
-        if instance.dias_restantes == 2:
-            Notificacion.objects.get_or_create(
-                usuario=instance.usuario,
-                tipo="vencimiento",
-                titulo="Préstamo próximo a vencer",
-                mensaje=f'El préstamo del libro "{instance.libro.titulo}" vence en 2 días. Fecha límite: {instance.fecha_devolucion_esperada.strftime("%d/%m/%Y")}',
-                defaults={"leido": False},
+@receiver(m2m_changed, sender=Libro.categorias.through)
+def contar_libros_categorias(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mantener el número de libros de las categorías al cambiar la relación"""
+    if action in ("pre_remove", "pre_clear"):
+        # Solo cuentan las relaciones que existen y van a desaparecer
+        relaciones = sender.objects.filter(
+            **{"categoria" if reverse else "libro": instance}
+        )
+        if pk_set is not None:
+            relaciones = relaciones.filter(
+                **{"libro_id__in" if reverse else "categoria_id__in": pk_set}
             )
+        instance._categorias_quitadas = list(
+            relaciones.values_list("categoria_id", flat=True)
+        )
+    elif action in ("post_remove", "post_clear"):
+        quitadas = getattr(instance, "_categorias_quitadas", [])
+        if reverse:
+            Categoria.ajustar_numero_libros([instance.pk], -len(quitadas))
+        else:
+            Categoria.ajustar_numero_libros(quitadas, -1)
+    elif action == "post_add" and pk_set:
+        # Django ya excluye de pk_set las relaciones que existían
+        if reverse:
+            Categoria.ajustar_numero_libros([instance.pk], len(pk_set))
+        else:
+            Categoria.ajustar_numero_libros(pk_set, 1)
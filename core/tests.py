@@ -1,3 +1,749 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import cloudinary
+from django.contrib.auth.models import Permission, User
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from .autocompletado import IndicePrefijos
+from .busqueda import buscar_libros, buscar_libros_aproximado, filtrar_por_texto
+from .exportacion import COLUMNAS
+from .importacion import CAMPOS_ACTUALIZABLES, importar_catalogo
+from .models import (
+    Autor,
+    Categoria,
+    Editorial,
+    Libro,
+    Notificacion,
+    Prestamo,
+    Resena,
+    Reserva,
+)
+from .proyecciones import proyectar_libros, valores_listado
+from .renderers import CamelCaseORJSONRenderer
+from .serializers import LibroListSerializer, PrestamoSerializer
+
+
+def en_paralelo(funcion, argumentos):
+    """Ejecuta funcion(argumento) a la vez en un hilo por argumento"""
+    barrera = threading.Barrier(len(argumentos))
+
+    def ejecutar(argumento):
+        try:
+            barrera.wait()
+            return funcion(argumento)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=len(argumentos)) as pool:
+        return list(pool.map(ejecutar, argumentos))
+
+
+@mock.patch.object(cloudinary.config(), "cloud_name", "pruebas", create=True)
+class ProyeccionListadoTests(TestCase):
+    """proyectar_libros debe dar el mismo JSON que LibroListSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Gabriel García Márquez")
+        editorial = Editorial.objects.create(nombre="Sudamericana")
+        novela = Categoria.objects.create(nombre="Novela", descripcion="Ficción")
+        clasicos = Categoria.objects.create(nombre="Clásicos")
+        con_portada = Libro.objects.create(
+            titulo="Cien años de soledad",
+            autor=autor,
+            editorial=editorial,
+            anio_publicacion=1967,
+            descripcion="Macondo y la familia Buendía",
+            portada="libros/cien_anios",
+            cantidad_total=2,
+            cantidad_disponible=0,
+            calificacion_promedio=4.5,
+            numero_resenas=2,
+            es_popular=True,
+        )
+        con_portada.categorias.set([novela, clasicos])
+        sin_portada = Libro.objects.create(
+            titulo="El otoño del patriarca",
+            autor=autor,
+            anio_publicacion=1975,
+            descripcion="Un dictador en Macondo",
+            es_nuevo=True,
+        )
+        sin_portada.categorias.set([novela])
+        Libro.objects.create(
+            titulo="Crónica de una muerte anunciada",
+            autor=autor,
+            anio_publicacion=1981,
+            descripcion="Santiago Nasar",
+        )
+
+    def renderizar(self, datos):
+        return CamelCaseJSONRenderer().render(datos)
+
+    def serializados(self, queryset, extra=()):
+        """Salida del serializer con las anotaciones `extra` al final"""
+        return [
+            {
+                **LibroListSerializer(libro).data,
+                **{campo: getattr(libro, campo) for campo in extra},
+            }
+            for libro in queryset.select_related("autor").prefetch_related("categorias")
+        ]
+
+    def test_listado(self):
+        queryset = Libro.objects.order_by("id")
+        esperado = self.renderizar(LibroListSerializer(queryset, many=True).data)
+        self.assertIn(b'"portada":null', esperado)
+        self.assertIn(b"cien_anios", esperado)
+        self.assertEqual(
+            self.renderizar(proyectar_libros(valores_listado(queryset))), esperado
+        )
+
+    def test_busqueda(self):
+        queryset = buscar_libros(Libro.objects.all(), "macondo")
+        extra = ("relevancia", "fragmento")
+        esperado = self.serializados(queryset, extra)
+        self.assertEqual(len(esperado), 2)
+        self.assertEqual(
+            self.renderizar(proyectar_libros(valores_listado(queryset, *extra), extra)),
+            self.renderizar(esperado),
+        )
+
+    def test_busqueda_aproximada(self):
+        queryset = buscar_libros_aproximado(Libro.objects.all(), "soledda")
+        extra = ("relevancia",)
+        esperado = self.serializados(queryset, extra)
+        self.assertTrue(esperado)
+        self.assertEqual(
+            self.renderizar(proyectar_libros(valores_listado(queryset, *extra), extra)),
+            self.renderizar(esperado),
+        )
+
+
+class PrestamoConcurrenteTests(TransactionTestCase):
+    """Préstamos simultáneos de un mismo libro desde varios hilos"""
+
+    hilos = 20
+
+    def prestar_en_paralelo(self, ejemplares):
+        autor = Autor.objects.create(nombre="Autor")
+        libro = Libro.objects.create(
+            titulo="Último ejemplar",
+            autor=autor,
+            anio_publicacion=2000,
+            descripcion="",
+            cantidad_total=ejemplares,
+            cantidad_disponible=ejemplares,
+        )
+        usuarios = [User.objects.create_user(f"lector{i}") for i in range(self.hilos)]
+
+        def prestar(usuario):
+            serializer = PrestamoSerializer(
+                data={"libro": libro.pk},
+                context={"request": SimpleNamespace(user=usuario, query_params={})},
+            )
+            try:
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            except ValidationError:
+                return False
+            return True
+
+        resultados = en_paralelo(prestar, usuarios)
+        libro.refresh_from_db()
+        return resultados, libro
+
+    def test_sin_sobreventas(self):
+        resultados, libro = self.prestar_en_paralelo(ejemplares=1)
+        self.assertEqual(sum(resultados), 1)
+        self.assertEqual(Prestamo.objects.filter(libro=libro).count(), 1)
+        self.assertEqual(libro.cantidad_disponible, 0)
+
+    def test_varios_ejemplares(self):
+        resultados, libro = self.prestar_en_paralelo(ejemplares=5)
+        self.assertEqual(sum(resultados), 5)
+        self.assertEqual(Prestamo.objects.filter(libro=libro).count(), 5)
+        self.assertEqual(libro.cantidad_disponible, 0)
+
+
+class DevolucionConcurrenteTests(TransactionTestCase):
+    """Devoluciones simultáneas de un libro con reservas pendientes"""
+
+    def test_cada_reserva_se_avisa_una_vez(self):
+        numero_prestamos, numero_reservas = 10, 6
+        autor = Autor.objects.create(nombre="Autor")
+        libro = Libro.objects.create(
+            titulo="Libro reservado",
+            autor=autor,
+            anio_publicacion=2000,
+            descripcion="",
+            cantidad_total=numero_prestamos,
+            cantidad_disponible=0,
+        )
+        usuarios = [
+            User.objects.create_user(f"lector{i}")
+            for i in range(numero_prestamos + numero_reservas)
+        ]
+        Prestamo.objects.bulk_create(
+            Prestamo(
+                usuario=usuario,
+                libro=libro,
+                fecha_devolucion_esperada=timezone.now(),
+            )
+            for usuario in usuarios[:numero_prestamos]
+        )
+        Reserva.objects.bulk_create(
+            Reserva(usuario=usuario, libro=libro)
+            for usuario in usuarios[numero_prestamos:]
+        )
+
+        # Cada préstamo se devuelve desde dos hilos con su propia instancia
+        tareas = [
+            prestamo
+            for _ in range(2)
+            for prestamo in Prestamo.objects.filter(libro=libro).select_related("libro")
+        ]
+        resultados = en_paralelo(lambda prestamo: prestamo.devolver(), tareas)
+
+        libro.refresh_from_db()
+        self.assertEqual(sum(resultados), numero_prestamos)
+        self.assertEqual(
+            Prestamo.objects.filter(libro=libro, estado="devuelto").count(),
+            numero_prestamos,
+        )
+        self.assertEqual(libro.cantidad_disponible, numero_prestamos)
+        self.assertEqual(
+            Reserva.objects.filter(libro=libro, estado="notificado").count(),
+            numero_reservas,
+        )
+        avisos = Notificacion.objects.filter(
+            usuario__in=usuarios[numero_prestamos:], tipo="reserva"
+        )
+        self.assertEqual(avisos.count(), numero_reservas)
+        self.assertEqual(avisos.values("usuario").distinct().count(), numero_reservas)
+
+
+class LimitePrestamosTests(TestCase):
+    """Los préstamos en curso cuentan para max_prestamos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("lector")
+        cls.usuario.perfil.max_prestamos = 2
+        cls.usuario.perfil.save()
+        autor = Autor.objects.create(nombre="Autor")
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f"Libro {i}", autor=autor, anio_publicacion=2000, descripcion=""
+            )
+            for i in range(2)
+        ]
+
+    def prestar(self, libro, estado="activo"):
+        return Prestamo.objects.create(
+            usuario=self.usuario,
+            libro=libro,
+            fecha_devolucion_esperada=timezone.now() + timedelta(days=7),
+            estado=estado,
+        )
+
+    def test_renovado_cuenta(self):
+        self.prestar(self.libros[0])
+        prestamo = self.prestar(self.libros[1])
+        self.assertTrue(prestamo.renovar())
+        perfil = self.usuario.perfil
+        self.assertEqual(perfil.prestamos_activos, 2)
+        self.assertFalse(perfil.puede_prestar)
+
+    def test_vencido_cuenta_y_devuelto_no(self):
+        self.prestar(self.libros[0], estado="vencido")
+        self.prestar(self.libros[1], estado="devuelto")
+        perfil = self.usuario.perfil
+        self.assertEqual(perfil.prestamos_activos, 1)
+        self.assertTrue(perfil.puede_prestar)
+
+
+class AgregadosResenasTests(TestCase):
+    """Los signals de Resena dejan lo mismo que recalcular_calificaciones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Autor")
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f"Libro {i}", autor=autor, anio_publicacion=2000, descripcion=""
+            )
+            for i in range(2)
+        ]
+        cls.usuarios = [User.objects.create_user(f"lector{i}") for i in range(3)]
+
+    def agregados(self):
+        return list(
+            Libro.objects.order_by("pk").values_list(
+                "pk", "suma_calificaciones", "numero_resenas", "calificacion_promedio"
+            )
+        )
+
+    def assertAgregadosCorrectos(self):
+        incrementales = self.agregados()
+        Libro.recalcular_calificaciones()
+        self.assertEqual(incrementales, self.agregados())
+
+    def resenar(self, libro, usuario, calificacion):
+        return Resena.objects.create(
+            libro=libro, usuario=usuario, calificacion=calificacion
+        )
+
+    def test_crear(self):
+        for usuario, calificacion in zip(self.usuarios, [5, 4, 2]):
+            self.resenar(self.libros[0], usuario, calificacion)
+        self.assertEqual(self.agregados()[0][1:], (11, 3, 11 / 3))
+        self.assertAgregadosCorrectos()
+
+    def test_editar_calificacion(self):
+        resena = self.resenar(self.libros[0], self.usuarios[0], 5)
+        self.resenar(self.libros[0], self.usuarios[1], 3)
+        resena.calificacion = 1
+        resena.save()
+        self.assertEqual(self.agregados()[0][1:], (4, 2, 2.0))
+        self.assertAgregadosCorrectos()
+
+    def test_mover_a_otro_libro(self):
+        resena = self.resenar(self.libros[0], self.usuarios[0], 5)
+        self.resenar(self.libros[0], self.usuarios[1], 3)
+        resena.libro = self.libros[1]
+        resena.calificacion = 4
+        resena.save()
+        self.assertEqual(self.agregados()[0][1:], (3, 1, 3.0))
+        self.assertEqual(self.agregados()[1][1:], (4, 1, 4.0))
+        self.assertAgregadosCorrectos()
+
+    def test_eliminar(self):
+        resena = self.resenar(self.libros[0], self.usuarios[0], 5)
+        resena.delete()
+        self.assertEqual(self.agregados()[0][1:], (0, 0, 0.0))
+        self.assertAgregadosCorrectos()
+
+    def test_eliminar_en_cascada(self):
+        for libro in self.libros:
+            self.resenar(libro, self.usuarios[0], 5)
+            self.resenar(libro, self.usuarios[1], 2)
+        self.usuarios[0].delete()
+        self.assertEqual(self.agregados()[0][1:], (2, 1, 2.0))
+        self.assertEqual(self.agregados()[1][1:], (2, 1, 2.0))
+        self.assertAgregadosCorrectos()
+
+
+class ContadoresLibrosTests(TestCase):
+    """numero_libros de autores y categorías coincide con COUNT(*)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autores = [Autor.objects.create(nombre=f"Autor {i}") for i in range(2)]
+        cls.categorias = [
+            Categoria.objects.create(nombre=f"Categoría {i}") for i in range(3)
+        ]
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f"Libro {i}",
+                autor=cls.autores[0],
+                anio_publicacion=2000,
+                descripcion="",
+            )
+            for i in range(3)
+        ]
+
+    def assertContadoresCorrectos(self):
+        for modelo in (Autor, Categoria):
+            contadores = modelo.objects.order_by("pk").values_list(
+                "pk", "numero_libros"
+            )
+            conteos = (
+                modelo.objects.order_by("pk")
+                .annotate(total=Count("libros"))
+                .values_list("pk", "total")
+            )
+            self.assertEqual(list(contadores), list(conteos))
+
+    def test_crear(self):
+        self.assertEqual(Autor.objects.get(pk=self.autores[0].pk).numero_libros, 3)
+        self.assertContadoresCorrectos()
+
+    def test_agregar_y_quitar(self):
+        libro = self.libros[0]
+        libro.categorias.add(*self.categorias[:2])
+        libro.categorias.add(self.categorias[0])  # ya existía: no cuenta
+        self.assertContadoresCorrectos()
+        libro.categorias.remove(self.categorias[0], self.categorias[2])
+        self.assertContadoresCorrectos()
+
+    def test_vaciar(self):
+        for libro in self.libros:
+            libro.categorias.set(self.categorias[:2])
+        self.libros[0].categorias.clear()
+        self.assertContadoresCorrectos()
+        self.categorias[1].libros.clear()
+        self.assertContadoresCorrectos()
+
+    def test_relacion_inversa(self):
+        categoria = self.categorias[0]
+        self.libros[0].categorias.add(categoria)
+        categoria.libros.add(*self.libros)
+        self.assertEqual(Categoria.objects.get(pk=categoria.pk).numero_libros, 3)
+        self.assertContadoresCorrectos()
+        categoria.libros.remove(self.libros[1])
+        self.assertContadoresCorrectos()
+
+    def test_reasignar_autor(self):
+        libro = self.libros[0]
+        libro.autor = self.autores[1]
+        libro.save()
+        libro.save()  # guardar sin cambios no mueve el contador
+        self.assertContadoresCorrectos()
+
+    def test_eliminar_libro(self):
+        self.libros[0].categorias.set(self.categorias)
+        self.libros[0].delete()
+        self.assertContadoresCorrectos()
+
+
+@mock.patch.object(cloudinary.config(), "cloud_name", "pruebas", create=True)
+class GetCondicionalLibrosTests(TestCase):
+    """El ETag del listado y del detalle cambia con lo que muestran"""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Autor")
+        cls.categoria = Categoria.objects.create(nombre="Novela")
+        cls.libro = Libro.objects.create(
+            titulo="Libro",
+            autor=autor,
+            anio_publicacion=2000,
+            descripcion="",
+            cantidad_total=2,
+            cantidad_disponible=2,
+        )
+        cls.lector = User.objects.create_user("lector")
+        cls.urls = ["/api/v1/libros/", f"/api/v1/libros/{cls.libro.pk}/"]
+
+    def etags(self):
+        etags = []
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags.append(response["ETag"])
+        return etags
+
+    def assertCambiaEtag(self, cambio):
+        antes = self.etags()
+        with self.captureOnCommitCallbacks(execute=True):
+            cambio()
+        despues = self.etags()
+        for url, etag_antes, etag_despues in zip(self.urls, antes, despues):
+            self.assertNotEqual(etag_antes, etag_despues, url)
+
+    def test_no_modificado(self):
+        for url, etag in zip(self.urls, self.etags()):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b"")
+
+    def test_resena(self):
+        self.assertCambiaEtag(
+            lambda: Resena.objects.create(
+                libro=self.libro, usuario=self.lector, calificacion=4
+            )
+        )
+
+    def test_existencias(self):
+        self.assertCambiaEtag(lambda: Libro.descontar_ejemplar(self.libro.pk))
+
+    def test_categorias(self):
+        self.assertCambiaEtag(lambda: self.libro.categorias.add(self.categoria))
+        self.categoria.nombre = "Novela negra"
+        self.assertCambiaEtag(self.categoria.save)
+
+    def test_perfil_de_quien_resena(self):
+        Resena.objects.create(libro=self.libro, usuario=self.lector, calificacion=4)
+        antes = self.client.get(self.urls[1])["ETag"]
+        self.lector.username = "lectora"
+        self.lector.save()
+        self.assertNotEqual(self.client.get(self.urls[1])["ETag"], antes)
+
+
+class RendererORJSONTests(TestCase):
+    """CamelCaseORJSONRenderer escribe los mismos bytes que el original"""
+
+    def test_mismos_bytes(self):
+        datos = {
+            "numero_grande": 1e16,
+            "numero_chico": 1e-7,
+            "numeros": [0.0, 0.1, 1e-4, 1e15, -1e17, 1.5e300, 5e-324, 2**70],
+            "fecha_con_zona": timezone.now(),
+            "fecha_sin_zona": datetime(2024, 1, 2, 3, 4, 5, 123456),
+            "dia": date(2024, 1, 2),
+            "importe": Decimal("1.10"),
+            "texto": "línea\u2028párrafo\u2029fin",
+            "anidado": [{"clave_interna": None, "otra_clave": True}],
+        }
+        self.assertEqual(
+            CamelCaseORJSONRenderer().render(datos),
+            CamelCaseJSONRenderer().render(datos),
+        )
+
+
+class AutocompletadoIsbnTests(TestCase):
+    """Un ISBN-10 con X final se encuentra con el índice y sin él"""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Autor")
+        cls.libro = Libro.objects.create(
+            titulo="Libro",
+            autor=autor,
+            isbn="080442957X",
+            anio_publicacion=2000,
+            descripcion="",
+        )
+
+    def test_isbn_con_x(self):
+        indice = IndicePrefijos()
+        esperado = [{"id": self.libro.pk, "tipo": "isbn", "etiqueta": "Libro"}]
+        for construido in (False, True):
+            if construido:
+                indice.construir()
+            else:
+                # Marca la construcción en curso para consultar la base de datos
+                indice._hilo = mock.Mock(is_alive=lambda: True)
+            for texto in ("080442957X", "080442957x"):
+                self.assertEqual(indice.buscar(texto), esperado, (construido, texto))
+
+
+class ReimportacionTests(TestCase):
+    """Volver a importar un catálogo solo reescribe los libros que cambian"""
+
+    registro = {
+        "isbn": "978-0-306-40615-7",
+        "titulo": "Cien años de soledad",
+        "autor": "Gabriel García Márquez",
+        "editorial": "Sudamericana",
+        "categorias": ["Novela", "Clásicos"],
+        "anio_publicacion": 1967,
+        "numero_paginas": 471,
+        "idioma": "Español",
+        "descripcion": "Macondo",
+        "tipo": "novela",
+        "cantidad_total": 3,
+    }
+
+    def importar(self, *registros):
+        archivo = io.StringIO("".join(json.dumps(r) + "\n" for r in registros))
+        return importar_catalogo(archivo, "jsonl")
+
+    def estado(self):
+        libro = Libro.objects.get(isbn="9780306406157")
+        categorias = sorted(libro.categorias.values_list("nombre", flat=True))
+        return libro, categorias
+
+    def test_sin_cambios(self):
+        self.importar(self.registro)
+        antes, categorias_antes = self.estado()
+        resumen = self.importar(self.registro)
+        self.assertEqual(
+            (resumen["creados"], resumen["actualizados"], resumen["sin_cambios"]),
+            (0, 0, 1),
+        )
+        despues, categorias_despues = self.estado()
+        self.assertEqual(despues.fecha_actualizado, antes.fecha_actualizado)
+        self.assertEqual(categorias_despues, categorias_antes)
+
+    def test_con_cambios(self):
+        self.importar(self.registro)
+        libro, _ = self.estado()
+        Libro.descontar_ejemplar(libro.pk)  # un ejemplar prestado
+        cambiado = {
+            **self.registro,
+            "titulo": "Cien años de soledad (edición conmemorativa)",
+            "autor": "G. García Márquez",
+            "editorial": "Alfaguara",
+            "categorias": ["Novela", "Realismo mágico"],
+            "anio_publicacion": 2007,
+            "numero_paginas": 496,
+            "idioma": "Inglés",
+            "descripcion": "Macondo y los Buendía",
+            "tipo": "ensayo",
+            "cantidad_total": 5,
+        }
+        resumen = self.importar(cambiado)
+        self.assertEqual(resumen["actualizados"], 1)
+
+        libro, categorias = self.estado()
+        esperado = {
+            "titulo": cambiado["titulo"],
+            "titulo_normalizado": "cien anos de soledad (edicion conmemorativa)",
+            "autor_id": Autor.objects.get(nombre="G. García Márquez").pk,
+            "editorial_id": Editorial.objects.get(nombre="Alfaguara").pk,
+            "anio_publicacion": 2007,
+            "numero_paginas": 496,
+            "idioma": "Inglés",
+            "descripcion": "Macondo y los Buendía",
+            "tipo": "ensayo",
+            "cantidad_total": 5,
+        }
+        self.assertEqual(set(esperado), set(CAMPOS_ACTUALIZABLES))
+        self.assertEqual(
+            {campo: getattr(libro, campo) for campo in CAMPOS_ACTUALIZABLES},
+            esperado,
+        )
+        # El ejemplar prestado sigue descontado
+        self.assertEqual(libro.cantidad_disponible, 4)
+        self.assertEqual(categorias, ["Novela", "Realismo mágico"])
+
+    def test_sin_isbn(self):
+        resumen = self.importar({**self.registro, "isbn": ""})
+        self.assertEqual(resumen["creados"], 0)
+        self.assertEqual(resumen["errores"], [(1, "isbn es obligatorio")])
+        self.assertFalse(Libro.objects.exists())
+
+
+class VectorBusquedaTests(TestCase):
+    """Guardar un libro solo recalcula su vector si cambian textos indexados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = Autor.objects.create(nombre="Gabriel García Márquez")
+        cls.libro = Libro.objects.create(
+            titulo="Cien años de soledad",
+            autor=cls.autor,
+            anio_publicacion=1967,
+            descripcion="Macondo",
+        )
+
+    def guardar(self, libro):
+        with CaptureQueriesContext(connection) as consultas:
+            libro.save()
+        return sum(
+            consulta["sql"].lstrip().startswith("UPDATE")
+            for consulta in consultas.captured_queries
+        )
+
+    def encontrado(self, texto):
+        return filtrar_por_texto(Libro.objects.filter(pk=self.libro.pk), texto).exists()
+
+    def test_sin_cambios_de_texto(self):
+        libro = Libro.objects.get(pk=self.libro.pk)
+        # El autor se renombra mientras la instancia está en memoria
+        self.autor.nombre = "Gabo"
+        self.autor.save()
+        libro.es_popular = True
+        self.assertEqual(self.guardar(libro), 1)
+        self.assertTrue(self.encontrado("gabo"))
+
+    def test_cambio_de_descripcion(self):
+        libro = Libro.objects.get(pk=self.libro.pk)
+        libro.descripcion = "Aureliano Buendía"
+        self.assertEqual(self.guardar(libro), 2)
+        self.assertTrue(self.encontrado("aureliano"))
+        self.assertFalse(self.encontrado("macondo"))
+
+
+@mock.patch.object(cloudinary.config(), "cloud_name", "pruebas", create=True)
+class ExportacionTests(TestCase):
+    """exportar transmite el catálogo en JSON Lines o CSV según el formato pedido"""
+
+    url = "/api/v1/libros/exportar/"
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Autor")
+        novela = Categoria.objects.create(nombre="Novela")
+        clasicos = Categoria.objects.create(nombre="Clásicos")
+        cls.libros = [
+            Libro.objects.create(
+                titulo=f"Libro {i}, tomo\u2028{i}",
+                autor=autor,
+                anio_publicacion=2000 + i,
+                descripcion='Con "comillas"',
+                isbn=f"978000000000{i}",
+            )
+            for i in range(3)
+        ]
+        cls.libros[0].categorias.set([novela, clasicos])
+        cls.consumidor = User.objects.create_user("consumidor")
+        cls.consumidor.user_permissions.add(
+            Permission.objects.get(codename="exportar_catalogo")
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.consumidor)
+
+    def exportar(self, **kwargs):
+        response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_jsonl(self):
+        response, contenido = self.exportar()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        filas = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual(
+            sorted(fila["id"] for fila in filas), [libro.pk for libro in self.libros]
+        )
+        self.assertEqual(set(filas[0]), set(COLUMNAS))
+        primero = next(fila for fila in filas if fila["id"] == self.libros[0].pk)
+        self.assertEqual(primero["titulo"], self.libros[0].titulo)
+        self.assertEqual(sorted(primero["categorias"]), ["Clásicos", "Novela"])
+
+    def test_csv(self):
+        response, contenido = self.exportar(data={"formato": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("catalogo.csv", response["Content-Disposition"])
+        filas = list(csv.reader(io.StringIO(contenido, newline="")))
+        self.assertEqual(filas[0], COLUMNAS)
+        self.assertEqual(len(filas), len(self.libros) + 1)
+        primero = dict(
+            zip(COLUMNAS, next(f for f in filas if f[0] == str(self.libros[0].pk)))
+        )
+        self.assertEqual(primero["titulo"], self.libros[0].titulo)
+        self.assertEqual(primero["descripcion"], 'Con "comillas"')
+        self.assertEqual(
+            sorted(primero["categorias"].split("|")), ["Clásicos", "Novela"]
+        )
+
+    def test_negociacion_por_accept(self):
+        for accept, tipo in [
+            ("text/csv", "text/csv"),
+            ("application/x-ndjson", "application/x-ndjson"),
+            ("text/csv;q=0.9, */*;q=0.1", "text/csv"),
+        ]:
+            response, _ = self.exportar(HTTP_ACCEPT=accept)
+            self.assertEqual(response["Content-Type"], tipo, accept)
+
+    def test_formato_no_soportado(self):
+        response = self.client.get(self.url, {"formato": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_permisos(self):
+        self.client.force_authenticate(User.objects.create_user("lector"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_authenticate(User.objects.create_user("staff", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
@@ -1,15 +1,38 @@
-from datetime import timedelta
+import hashlib
+import math
 
 from django.contrib.auth.models import User
-from django.db.models import Avg, Count, Q
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.permissions import (
+    AllowAny,
+    BasePermission,
+    IsAdminUser,
+    IsAuthenticated,
+)
 from rest_framework.response import Response
 
+from .autocompletado import indice_autocompletado
+from .busqueda import (
+    UMBRAL_MINIMO,
+    buscar_libros,
+    buscar_libros_aproximado,
+    filtrar_por_texto,
+    sugerencias,
+)
+from .cache import respuesta_prerenderizada, versiones_modelos
+from .exportacion import FORMATOS, lineas_exportacion
+from .facetas import facetas_cacheadas, parametros_filtro
+from .lotes import LOTE_MAXIMO, guardar_libros
 from .models import (
     Autor,
     Categoria,
@@ -21,6 +44,7 @@ from .models import (
     Resena,
     Reserva,
 )
+from .proyecciones import proyectar_libros, valores_listado
 from .serializers import (
     AutorSerializer,
     CategoriaSerializer,
@@ -34,8 +58,22 @@ from .serializers import (
     ResenaSerializer,
     ReservaSerializer,
     UserRegistrationSerializer,
+    campos_pedidos,
 )
 
+# Modelos cuyos cambios invalidan los bloques prerenderizados de libros
+MODELOS_PORTADA = [Libro, Resena, Categoria, Autor, Editorial]
+
+
+class PuedeExportarCatalogo(BasePermission):
+    """Staff o usuarios con el permiso core.exportar_catalogo"""
+
+    def has_permission(self, request, view):
+        usuario = request.user
+        return bool(
+            usuario and (usuario.is_staff or usuario.has_perm("core.exportar_catalogo"))
+        )
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
@@ -43,7 +81,100 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class AutorViewSet(viewsets.ModelViewSet):
+class CursorResultsSetPagination(CursorPagination):
+    """Paginación por cursor (keyset) sin COUNT ni OFFSET"""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        """Añade el id como desempate para que el orden sea estable"""
+        ordering = super().get_ordering(request, queryset, view)
+        if not {"id", "-id", "pk", "-pk"} & set(ordering):
+            ordering += ("-id" if ordering[0].startswith("-") else "id",)
+        return ordering
+
+
+class PaginacionCursorMixin:
+    """Permite optar por paginación por cursor con ?paginacion=cursor"""
+
+    acciones_cursor = ["list"]
+
+    def usa_paginacion_cursor(self):
+        params = self.request.query_params
+        return self.action in self.acciones_cursor and (
+            params.get("paginacion") == "cursor" or "cursor" in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self.usa_paginacion_cursor():
+            self._paginator = CursorResultsSetPagination()
+        return super().paginator
+
+    def listar_opcionalmente_paginado(self, queryset):
+        """Pagina por cursor si se pidió; si no, conserva la lista completa"""
+        if self.usa_paginacion_cursor():
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class GetCondicionalMixin:
+    """Responde 304 Not Modified a list/retrieve si el cliente está al día.
+
+    Los validadores se calculan antes de serializar. El ETag incluye el
+    formato de salida y los parámetros de la consulta; Last-Modified solo
+    es orientativo porque no refleja borrados ni cambios en modelos
+    relacionados, así que los clientes deben preferir If-None-Match.
+    """
+
+    acciones_condicionales = ["list", "retrieve"]
+    modelos_condicionales = []
+
+    def validadores(self):
+        """Devuelve (firma, última modificación) del recurso o None"""
+        return versiones_modelos(*self.modelos_condicionales), None
+
+    def _responder_condicional(self, vista, request, *args, **kwargs):
+        validadores = None
+        if request.method in ("GET", "HEAD"):
+            validadores = self.validadores()
+        if validadores is None:
+            return vista(request, *args, **kwargs)
+
+        firma, ultima_modificacion = validadores
+        params = sorted(request.query_params.lists())
+        formato = request.accepted_renderer.format
+        etag = quote_etag(
+            hashlib.md5(repr((firma, formato, params)).encode()).hexdigest()
+        )
+        timestamp = ultima_modificacion and int(ultima_modificacion.timestamp())
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if response is not None:
+            return response
+
+        response = vista(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+            if timestamp:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._responder_condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._responder_condicional(super().retrieve, request, *args, **kwargs)
+
+
+class AutorViewSet(GetCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar autores"""
 
     queryset = Autor.objects.all()
@@ -53,6 +184,7 @@ class AutorViewSet(viewsets.ModelViewSet):
     search_fields = ["nombre", "biografia", "nacionalidad"]
     ordering_fields = ["nombre", "fecha_nacimiento"]
     ordering = ["nombre"]
+    modelos_condicionales = [Autor]
 
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
@@ -63,14 +195,12 @@ class AutorViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["get"])
     def libros(self, request, pk=None):
-        """Obtiene todos los libros de un autor"""
+        """Obtiene los libros de un autor, paginados"""
         autor = self.get_object()
-        libros = autor.libros.all()
-        serializer = LibroListSerializer(libros, many=True)
-        return Response(serializer.data)
+        return LibroViewSet.listar_libros(request, autor=autor)
 
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(GetCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar categorías"""
 
     queryset = Categoria.objects.all()
@@ -79,6 +209,7 @@ class CategoriaViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["nombre", "descripcion"]
     ordering = ["nombre"]
+    modelos_condicionales = [Categoria]
 
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
@@ -89,18 +220,9 @@ class CategoriaViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["get"])
     def libros(self, request, pk=None):
-        """Obtiene todos los libros de una categoría"""
+        """Obtiene los libros de una categoría, paginados"""
         categoria = self.get_object()
-        libros = categoria.libros.all()
-
-        # Aplicar filtros adicionales
-        disponible = request.query_params.get("disponible", None)
-        if disponible is not None:
-            if disponible.lower() == "true":
-                libros = libros.filter(cantidad_disponible__gt=0)
-
-        serializer = LibroListSerializer(libros, many=True)
-        return Response(serializer.data)
+        return LibroViewSet.listar_libros(request, categorias=categoria)
 
 
 class EditorialViewSet(viewsets.ModelViewSet):
@@ -121,7 +243,7 @@ class EditorialViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class LibroViewSet(viewsets.ModelViewSet):
+class LibroViewSet(GetCondicionalMixin, PaginacionCursorMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar libros"""
 
     queryset = (
@@ -136,8 +258,18 @@ class LibroViewSet(viewsets.ModelViewSet):
         filters.OrderingFilter,
     ]
     search_fields = ["titulo", "autor__nombre", "descripcion", "isbn"]
-    ordering_fields = ["titulo", "anio_publicacion", "fecha_agregado"]
+    ordering_fields = [
+        "titulo",
+        "anio_publicacion",
+        "fecha_agregado",
+        "calificacion_promedio",
+        "numero_resenas",
+    ]
     ordering = ["-fecha_agregado"]
+    # Modelos que aparecen anidados en las respuestas de libros
+    modelos_condicionales = [Autor, Categoria, Editorial]
+    # Libros que se pueden pedir de una vez en `multiple`
+    maximo_multiple = 200
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -145,12 +277,32 @@ class LibroViewSet(viewsets.ModelViewSet):
         return LibroDetailSerializer
 
     def get_permissions(self):
-        if self.action in ["list", "retrieve", "buscar", "populares", "nuevos"]:
+        if self.action in [
+            "list",
+            "retrieve",
+            "buscar",
+            "autocompletar",
+            "facetas",
+            "populares",
+            "nuevos",
+            "multiple",
+        ]:
             permission_classes = [AllowAny]
+        elif self.action in ["prestar", "reservar"]:
+            # Los declarados en @action (IsAuthenticated)
+            return super().get_permissions()
+        elif self.action == "exportar":
+            permission_classes = [PuedeExportarCatalogo]
         else:
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    def perform_content_negotiation(self, request, force=False):
+        # exportar responde en CSV o JSON Lines, tipos que ningún renderer de
+        # DRF ofrece; sin forzar, Accept: text/csv acabaría en 406
+        force = force or self.action == "exportar"
+        return super().perform_content_negotiation(request, force)
+
     def get_queryset(self):
         queryset = super().get_queryset()
 
@@ -187,46 +339,282 @@ class LibroViewSet(viewsets.ModelViewSet):
         if anio_hasta:
             queryset = queryset.filter(anio_publicacion__lte=anio_hasta)
 
-        return queryset.distinct()
+        if self.action == "retrieve":
+            queryset = LibroDetailSerializer.optimizar_queryset(
+                queryset, *campos_pedidos(self.request)
+            )
+
+        # No se necesita distinct(): el filtro por una sola categoría no
+        # duplica filas porque el par libro-categoría es único
+        return queryset
+
+    def validadores(self):
+        versiones = versiones_modelos(*self.modelos_condicionales)
+        if self.action == "retrieve":
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            # Solo las reseñas de este libro y los perfiles de quienes las
+            # escribieron (nombre y foto se muestran en el detalle): las
+            # versiones globales cambian con cualquier reseña o perfil
+            try:
+                fila = (
+                    Libro.objects.filter(**{self.lookup_field: self.kwargs[lookup]})
+                    .annotate(
+                        ultima_resena=Max("resenas__fecha_actualizado"),
+                        ultimo_perfil=Max(
+                            "resenas__usuario__perfil__fecha_actualizado"
+                        ),
+                        resenas_totales=Count("resenas"),
+                    )
+                    .values_list(
+                        "fecha_actualizado",
+                        "ultima_resena",
+                        "ultimo_perfil",
+                        "resenas_totales",
+                    )
+                    .first()
+                )
+            except (ValueError, TypeError, ValidationError):
+                # get_object() responderá 404
+                return None
+            if fila is None:
+                return None
+            fecha = max(filter(None, fila[:3]))
+            return (self.kwargs[lookup], fila, versiones), fecha
+
+        # El conteo detecta los borrados, que no cambian el máximo
+        resumen = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .aggregate(ultima=Max("fecha_actualizado"), total=Count("id"))
+        )
+        return (resumen["total"], resumen["ultima"], versiones), resumen["ultima"]
+
+    def listar_proyectado(self, queryset, extra=()):
+        """Pagina y serializa el listado sin instanciar modelos"""
+        campos, expandir = campos_pedidos(self.request)
+        filas = valores_listado(queryset, *extra, campos=campos)
+        page = self.paginate_queryset(filas)
+        if page is not None:
+            return self.get_paginated_response(
+                proyectar_libros(page, extra, campos, expandir)
+            )
+        return Response(proyectar_libros(filas, extra, campos, expandir))
+
+    @classmethod
+    def listar_libros(cls, request, **filtros):
+        """Listado de libros con los filtros, orden y paginación de `list`.
+
+        Lo usan las acciones `libros` de otros ViewSets.
+        """
+        vista = cls(request=request, args=(), kwargs={}, format_kwarg=None)
+        vista.action = "list"
+        queryset = vista.filter_queryset(vista.get_queryset().filter(**filtros))
+        return vista.listar_proyectado(queryset)
+
+    def list(self, request, *args, **kwargs):
+        return self._responder_condicional(self._listar, request, *args, **kwargs)
+
+    def _listar(self, request, *args, **kwargs):
+        return self.listar_proyectado(self.filter_queryset(self.get_queryset()))
+
+    def _destacados(self, nombre, construir):
+        """Cachea el bloque ya renderizado cuando no hay filtros en la petición"""
+        campos, expandir = campos_pedidos(self.request)
+        if parametros_filtro(self.request.query_params) or campos or expandir:
+            return Response(construir())
+        # El detalle muestra reseñas con el nombre y la foto de sus autores
+        modelos = MODELOS_PORTADA + [PerfilUsuario]
+        return respuesta_prerenderizada(
+            self.request, nombre, modelos, construir, self.get_renderer_context()
+        )
 
     @action(detail=False, methods=["get"])
     def populares(self, request):
         """Obtiene libros populares"""
-        libros = self.get_queryset().filter(es_popular=True)[:10]
-        serializer = self.get_serializer(libros, many=True)
-        return Response(serializer.data)
+
+        def construir():
+            libros = LibroDetailSerializer.optimizar_queryset(
+                self.get_queryset().filter(es_popular=True),
+                *campos_pedidos(request),
+            )[:10]
+            return self.get_serializer(libros, many=True).data
+
+        return self._destacados("libros_populares", construir)
 
     @action(detail=False, methods=["get"])
     def nuevos(self, request):
         """Obtiene nuevas adquisiciones"""
-        libros = (
-            self.get_queryset().filter(es_nuevo=True).order_by("-fecha_agregado")[:10]
+
+        def construir():
+            libros = LibroDetailSerializer.optimizar_queryset(
+                self.get_queryset().filter(es_nuevo=True).order_by("-fecha_agregado"),
+                *campos_pedidos(request),
+            )[:10]
+            return self.get_serializer(libros, many=True).data
+
+        return self._destacados("libros_nuevos", construir)
+
+    @action(detail=False, methods=["get"])
+    def multiple(self, request):
+        """Obtiene varios libros por id o ISBN en el orden pedido"""
+        ids = request.query_params.get("ids")
+        isbns = request.query_params.get("isbn")
+        if (ids is None) == (isbns is None):
+            return Response(
+                {"error": 'Indique "ids" o "isbn" separados por comas'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        campo = "id" if ids is not None else "isbn"
+        # dict.fromkeys quita los repetidos conservando el orden
+        valores = list(
+            dict.fromkeys(v.strip() for v in (ids or isbns).split(",") if v.strip())
+        )
+        if campo == "id":
+            try:
+                valores = list(dict.fromkeys(int(valor) for valor in valores))
+            except ValueError:
+                return Response(
+                    {"error": "Los ids deben ser números enteros"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        if not valores or len(valores) > self.maximo_multiple:
+            return Response(
+                {"error": f"Indique entre 1 y {self.maximo_multiple} libros"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        vista = request.query_params.get("vista", "compacta")
+        queryset = Libro.objects.filter(**{f"{campo}__in": valores})
+        campos, expandir = campos_pedidos(request)
+        if vista == "compacta":
+            filas = list(valores_listado(queryset, "isbn", campos=campos))
+            libros = proyectar_libros(filas, (), campos, expandir)
+            claves = [fila[campo] for fila in filas]
+        elif vista == "detalle":
+            objetos = list(
+                LibroDetailSerializer.optimizar_queryset(queryset, campos, expandir)
+            )
+            libros = LibroDetailSerializer(
+                objetos, many=True, context=self.get_serializer_context()
+            ).data
+            claves = [getattr(libro, campo) for libro in objetos]
+        else:
+            return Response(
+                {"error": "Vista no soportada. Opciones: compacta, detalle"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        por_clave = dict(zip(claves, libros))
+        return Response(
+            {
+                "libros": [por_clave[v] for v in valores if v in por_clave],
+                "faltantes": [v for v in valores if v not in por_clave],
+            }
         )
-        serializer = self.get_serializer(libros, many=True)
-        return Response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def buscar(self, request):
         """Búsqueda avanzada de libros"""
-        query = request.query_params.get("q", "")
+        query = request.query_params.get("q", "").strip()
+        modo = request.query_params.get("modo", None)
+        umbral = None
+        try:
+            umbral = float(request.query_params["umbral"])
+        except (KeyError, ValueError):
+            pass
+        else:
+            # nan o inf se ignoran como cualquier otro valor inválido; un umbral
+            # demasiado bajo haría que la consulta recorra toda la tabla
+            if math.isfinite(umbral):
+                umbral = min(max(umbral, UMBRAL_MINIMO), 1.0)
+            else:
+                umbral = None
+
+        if query and modo == "aproximado":
+            # El umbral se fija solo para esta transacción
+            with transaction.atomic():
+                queryset = buscar_libros_aproximado(self.get_queryset(), query, umbral)
+                response = self.listar_proyectado(queryset, ("relevancia",))
+        else:
+            if query:
+                queryset = buscar_libros(self.get_queryset(), query)
+                extra = ("relevancia", "fragmento")
+            else:
+                queryset = self.get_queryset()
+                extra = ()
+            response = self.listar_proyectado(queryset, extra)
+
+        # Sugerencias "quizás quisiste decir" cuando no hay resultados
+        if query and "results" in response.data and not response.data["results"]:
+            response.data["sugerencias"] = sugerencias(query, umbral=umbral)
+        return response
 
+    @action(detail=False, methods=["get"])
+    def facetas(self, request):
+        """Conteos por categoría, tipo, idioma, editorial y década del filtro actual"""
+        queryset = self.get_queryset()
+        query = request.query_params.get("q", "").strip()
         if query:
-            queryset = self.get_queryset().filter(
-                Q(titulo__icontains=query)
-                | Q(autor__nombre__icontains=query)
-                | Q(descripcion__icontains=query)
-                | Q(isbn__icontains=query)
+            queryset = filtrar_por_texto(queryset, query)
+        return Response(facetas_cacheadas(queryset, request.query_params))
+
+    @action(detail=False, methods=["get"])
+    def autocompletar(self, request):
+        """Sugerencias por prefijo de título, autor o ISBN para la caja de búsqueda"""
+        query = request.query_params.get("q", "")
+        try:
+            limite = min(max(int(request.query_params.get("limite", 8)), 1), 20)
+        except ValueError:
+            limite = 8
+        return Response(indice_autocompletado.buscar(query, limite))
+
+    @action(detail=False, methods=["get"])
+    def exportar(self, request):
+        """Exporta el catálogo completo en JSON Lines o CSV en streaming"""
+        formato = request.query_params.get("formato")
+        if formato is None:
+            # Sin ?formato= se respeta la cabecera Accept
+            aceptados = request.META.get("HTTP_ACCEPT", "")
+            formato = next(
+                (f for f, tipo in FORMATOS.items() if tipo in aceptados), "jsonl"
             )
-        else:
-            queryset = self.get_queryset()
+        if formato not in FORMATOS:
+            return Response(
+                {"error": f"Formato no soportado. Opciones: {', '.join(FORMATOS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        response = StreamingHttpResponse(
+            lineas_exportacion(formato, self.get_queryset()),
+            content_type=FORMATOS[formato],
+        )
+        response["Content-Disposition"] = f'attachment; filename="catalogo.{formato}"'
+        return response
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = LibroListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+    @action(detail=False, methods=["post"])
+    def lote(self, request):
+        """Crea o actualiza una lista de libros con errores por elemento"""
+        if not isinstance(request.data, list) or not request.data:
+            return Response(
+                {"error": "Se esperaba una lista de libros"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > LOTE_MAXIMO:
+            return Response(
+                {"error": f"Máximo {LOTE_MAXIMO} libros por lote"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        serializer = LibroListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        resultados = guardar_libros(request.data)
+        errores = sum(1 for resultado in resultados if "errores" in resultado)
+        if errores == len(resultados):
+            codigo = status.HTTP_400_BAD_REQUEST
+        elif errores:
+            codigo = status.HTTP_207_MULTI_STATUS
+        elif any(resultado["estado"] == "creado" for resultado in resultados):
+            codigo = status.HTTP_201_CREATED
+        else:
+            codigo = status.HTTP_200_OK
+        return Response({"resultados": resultados}, status=codigo)
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def prestar(self, request, pk=None):
@@ -257,20 +645,25 @@ class LibroViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PrestamoViewSet(viewsets.ModelViewSet):
+class PrestamoViewSet(PaginacionCursorMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar préstamos"""
 
-    queryset = Prestamo.objects.all().select_related("usuario", "libro", "libro__autor")
+    queryset = Prestamo.objects.all()
     serializer_class = PrestamoSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     ordering_fields = ["fecha_prestamo", "fecha_devolucion_esperada"]
     ordering = ["-fecha_prestamo"]
+    acciones_cursor = ["list", "activos", "historial"]
+    # Préstamos que acepta `devolver_lote` por petición
+    maximo_devolucion_lote = 500
 
     def get_queryset(self):
         user = self.request.user
-        queryset = super().get_queryset()
+        queryset = self.get_serializer_class().optimizar_queryset(
+            super().get_queryset(), *campos_pedidos(self.request)
+        )
 
         # Los usuarios normales solo ven sus préstamos
         if not user.is_staff:
@@ -285,12 +678,11 @@ class PrestamoViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def activos(self, request):
-        """Obtiene préstamos activos del usuario"""
+        """Obtiene los préstamos en curso del usuario, vencidos incluidos"""
         prestamos = self.get_queryset().filter(
-            usuario=request.user, estado__in=["activo", "renovado"]
+            usuario=request.user, estado__in=Prestamo.ESTADOS_PRESTADO
         )
-        serializer = self.get_serializer(prestamos, many=True)
-        return Response(serializer.data)
+        return self.listar_opcionalmente_paginado(prestamos)
 
     @action(detail=False, methods=["get"])
     def historial(self, request):
@@ -344,35 +736,9 @@ class PrestamoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
+        # Devuelve el ejemplar, avisa a la primera reserva pendiente y crea
+        # las notificaciones en una sola transacción
         if prestamo.devolver():
-            # Crear notificación
-            Notificacion.objects.create(
-                usuario=prestamo.usuario,
-                tipo="devolucion",
-                titulo="Libro devuelto",
-                mensaje=f'Has devuelto el libro "{prestamo.libro.titulo}". ¡Gracias!',
-            )
-
-            # Verificar si hay reservas pendientes
-            reserva = (
-                Reserva.objects.filter(libro=prestamo.libro, estado="pendiente")
-                .order_by("fecha_reserva")
-                .first()
-            )
-
-            if reserva:
-                reserva.estado = "notificado"
-                reserva.fecha_notificacion = timezone.now()
-                reserva.fecha_expiracion = timezone.now() + timedelta(days=3)
-                reserva.save()
-
-                Notificacion.objects.create(
-                    usuario=reserva.usuario,
-                    tipo="reserva",
-                    titulo="Libro disponible",
-                    mensaje=f'El libro "{prestamo.libro.titulo}" que reservaste ya está disponible. Tienes 3 días para recogerlo.',
-                )
-
             serializer = self.get_serializer(prestamo)
             return Response(serializer.data)
 
@@ -381,14 +747,48 @@ class PrestamoViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    @action(detail=False, methods=["post"])
+    def devolver_lote(self, request):
+        """Devolver varios préstamos a la vez (carro del mostrador)"""
+        if not request.user.is_staff:
+            return Response(
+                {"error": "Solo el personal puede marcar libros como devueltos"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if (
+            not isinstance(ids, list)
+            or not ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+        ):
+            return Response(
+                {"error": 'Se esperaba "ids" con una lista de ids de préstamos'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(ids) > self.maximo_devolucion_lote:
+            return Response(
+                {"error": f"Máximo {self.maximo_devolucion_lote} préstamos por lote"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        devueltos = set(Prestamo.devolver_lote(ids))
+        return Response(
+            {
+                "devueltos": [i for i in ids if i in devueltos],
+                "no_devueltos": [i for i in ids if i not in devueltos],
+            }
+        )
+
 
-class ResenaViewSet(viewsets.ModelViewSet):
+class ResenaViewSet(PaginacionCursorMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar reseñas"""
 
     queryset = Resena.objects.all().select_related("usuario", "libro")
     serializer_class = ResenaSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    ordering = ["-fecha_creacion"]
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -423,17 +823,21 @@ class ResenaViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class ReservaViewSet(viewsets.ModelViewSet):
+class ReservaViewSet(PaginacionCursorMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar reservas"""
 
-    queryset = Reserva.objects.all().select_related("usuario", "libro", "libro__autor")
+    queryset = Reserva.objects.all()
     serializer_class = ReservaSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    ordering = ["fecha_reserva"]
+    acciones_cursor = ["list", "activas"]
 
     def get_queryset(self):
         user = self.request.user
-        queryset = super().get_queryset()
+        queryset = self.get_serializer_class().optimizar_queryset(
+            super().get_queryset(), *campos_pedidos(self.request)
+        )
 
         if not user.is_staff:
             queryset = queryset.filter(usuario=user)
@@ -450,8 +854,7 @@ class ReservaViewSet(viewsets.ModelViewSet):
         reservas = self.get_queryset().filter(
             usuario=request.user, estado__in=["pendiente", "notificado"]
         )
-        serializer = self.get_serializer(reservas, many=True)
-        return Response(serializer.data)
+        return self.listar_opcionalmente_paginado(reservas)
 
     @action(detail=True, methods=["post"])
     def cancelar(self, request, pk=None):
@@ -471,13 +874,15 @@ class ReservaViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class NotificacionViewSet(viewsets.ModelViewSet):
+class NotificacionViewSet(PaginacionCursorMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar notificaciones"""
 
     queryset = Notificacion.objects.all().select_related("usuario")
     serializer_class = NotificacionSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    ordering = ["-fecha_creacion"]
+    acciones_cursor = ["list", "no_leidas"]
 
     def get_queryset(self):
         return super().get_queryset().filter(usuario=self.request.user)
@@ -486,8 +891,7 @@ class NotificacionViewSet(viewsets.ModelViewSet):
     def no_leidas(self, request):
         """Obtiene notificaciones no leídas"""
         notificaciones = self.get_queryset().filter(leido=False)
-        serializer = self.get_serializer(notificaciones, many=True)
-        return Response(serializer.data)
+        return self.listar_opcionalmente_paginado(notificaciones)
 
     @action(detail=True, methods=["post"])
     def marcar_leida(self, request, pk=None):
@@ -554,8 +958,9 @@ def estadisticas_usuario(request):
     """Obtiene estadísticas del usuario"""
     user = request.user
 
+    # Los vencidos siguen en manos del usuario
     prestamos_activos = Prestamo.objects.filter(
-        usuario=user, estado__in=["activo", "renovado"]
+        usuario=user, estado__in=Prestamo.ESTADOS_PRESTADO
     ).count()
 
     prestamos_totales = Prestamo.objects.filter(usuario=user).count()
@@ -573,8 +978,11 @@ def estadisticas_usuario(request):
         or 0
     )
 
+    # Los vencidos que marcar_vencidos aún no ha procesado siguen como activos
     libros_vencidos = Prestamo.objects.filter(
-        usuario=user, estado="activo", fecha_devolucion_esperada__lt=timezone.now()
+        Q(estado="vencido")
+        | Q(estado="activo", fecha_devolucion_esperada__lt=timezone.now()),
+        usuario=user,
     ).count()
 
     data = {
@@ -594,16 +1002,16 @@ def estadisticas_usuario(request):
 @permission_classes([AllowAny])
 def inicio(request):
     """Endpoint para la pantalla de inicio con libros populares y nuevos"""
-    libros_populares = Libro.objects.filter(es_popular=True)[:6]
-    nuevas_adquisiciones = Libro.objects.filter(es_nuevo=True).order_by(
-        "-fecha_agregado"
-    )[:6]
-
-    return Response(
-        {
-            "libros_populares": LibroListSerializer(libros_populares, many=True).data,
-            "nuevas_adquisiciones": LibroListSerializer(
-                nuevas_adquisiciones, many=True
-            ).data,
+
+    def construir():
+        libros = valores_listado(Libro.objects.all())
+        libros_populares = libros.filter(es_popular=True)[:6]
+        nuevas_adquisiciones = libros.filter(es_nuevo=True).order_by("-fecha_agregado")[
+            :6
+        ]
+        return {
+            "libros_populares": proyectar_libros(libros_populares),
+            "nuevas_adquisiciones": proyectar_libros(nuevas_adquisiciones),
         }
-    )
+
+    return respuesta_prerenderizada(request, "inicio", MODELOS_PORTADA, construir)
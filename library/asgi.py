@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library.settings')
 
 application = get_asgi_application()
+
+# Cada proceso construye en segundo plano su índice de autocompletado
+from core.autocompletado import indice_autocompletado  # noqa: E402
+
+indice_autocompletado.calentar()
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # Third party apps
     "rest_framework",
     "rest_framework_simplejwt",
@@ -101,6 +102,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Dos niveles: una LRU pequeña en cada proceso delante de una cache
+# compartida. Con REDIS_URL la compartida es Redis (paquete redis, ya
+# declarado); sin ella se usa LocMemCache, suficiente para desarrollo.
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+CACHES = {
+    "default": {
+        "BACKEND": "core.cache.CacheDosNiveles",
+        "OPTIONS": {
+            "COMPARTIDA": "compartida",
+            "MAX_ENTRADAS": 1000,
+            "TTL_LOCAL": 5,
+        },
+    },
+    "compartida": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+        if REDIS_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "biblioteca",
+        }
+    ),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -146,6 +178,20 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
 # REST Framework configuration
+# Mismo formato camelCase que djangorestframework-camel-case, codificado
+# con orjson. MessagePack y CBOR se ofrecen por negociación (Accept o
+# ?format=).
+RENDERER_CLASSES = [
+    "core.renderers.CamelCaseORJSONRenderer",
+    "core.renderers.CamelCaseMessagePackRenderer",
+    "core.renderers.CamelCaseCBORRenderer",
+]
+PARSER_CLASSES = [
+    "core.renderers.CamelCaseORJSONParser",
+    "core.renderers.CamelCaseMessagePackParser",
+    "core.renderers.CamelCaseCBORParser",
+]
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -158,16 +204,21 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
         "rest_framework.filters.OrderingFilter",
     ],
-    "DEFAULT_RENDERER_CLASSES": [
-        "djangorestframework_camel_case.render.CamelCaseJSONRenderer",
-    ],
-    "DEFAULT_PARSER_CLASSES": [
-        "djangorestframework_camel_case.parser.CamelCaseJSONParser",
-    ],
+    "DEFAULT_RENDERER_CLASSES": RENDERER_CLASSES,
+    "DEFAULT_PARSER_CLASSES": PARSER_CLASSES,
     "DATETIME_FORMAT": "%Y-%m-%d %H:%M:%S",
     "DATE_FORMAT": "%Y-%m-%d",
 }
 
+# Búsqueda aproximada (pg_trgm): similitud mínima entre 0.1 y 1
+BUSQUEDA_UMBRAL_SIMILITUD = float(os.environ.get("BUSQUEDA_UMBRAL_SIMILITUD", "0.3"))
+
+# Reseñas más recientes incluidas en el detalle de un libro
+RESENAS_DETALLE_LIMITE = int(os.environ.get("RESENAS_DETALLE_LIMITE", "5"))
+
+# Días de antelación con que enviar_recordatorios avisa de un vencimiento
+DIAS_AVISO_VENCIMIENTO = int(os.environ.get("DIAS_AVISO_VENCIMIENTO", "2"))
+
 # JWT Configuration
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=5),